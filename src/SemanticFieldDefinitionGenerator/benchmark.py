@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Benchmarks for the generator and parser using synthetic field definitions.
+
+run with: python -m SemanticFieldDefinitionGenerator.benchmark
+or run the benchmark suite with JSON results: semantic-field-util bench
+"""
+from SemanticFieldDefinitionGenerator import generator, parser, rdf_generator
+from rdflib import Dataset
+from datetime import datetime, timezone
+from pathlib import Path
+import copy
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import yaml
+
+FIELD_PREFIX = 'http://example.org/fields/'
+# modules imported by the command line actions
+ACTION_IMPORTS = {
+    'cli': ['SemanticFieldDefinitionGenerator.semantic_field_util'],
+    'write': ['SemanticFieldDefinitionGenerator.semantic_field_util', 'SemanticFieldDefinitionGenerator.generator'],
+    'write_templates': ['SemanticFieldDefinitionGenerator.semantic_field_util', 'SemanticFieldDefinitionGenerator.generator',
+                        'pybars'],
+    'write_nquads': ['SemanticFieldDefinitionGenerator.semantic_field_util', 'SemanticFieldDefinitionGenerator.rdf_generator'],
+    'read': ['SemanticFieldDefinitionGenerator.semantic_field_util', 'SemanticFieldDefinitionGenerator.parser'],
+    'sync': ['SemanticFieldDefinitionGenerator.semantic_field_util', 'SemanticFieldDefinitionGenerator.sync'],
+}
+FLAVOR_NAMES = {
+    generator.UNIVERSAL: 'UNI',
+    generator.RESEARCHSPACE: 'RS',
+    generator.METAPHACTS: 'MP',
+    generator.JSON: 'JSON',
+    generator.INLINE: 'INLINE',
+}
+
+
+def _pad_query(query, query_length):
+    # pad query ending with ' }' with triple patterns to at least query_length characters
+    patterns = []
+    n = 0
+    while len(query) + sum(len(p) for p in patterns) < query_length:
+        patterns.append(f' . ?value rdfs:comment ?comment{n}')
+        n += 1
+    return query[:-2] + ''.join(patterns) + ' }'
+
+def synthetic_model(num_fields=1000, cardinality=1, query_length=None):
+    """create field definition model with num_fields synthetic fields.
+    cardinality: number of domain, range and defaultValue values per field
+    query_length: minimum length of select queries
+    """
+    fields = []
+    for i in range(num_fields):
+        field = {
+            'id': f'field{i}',
+            'label': f'Field {i}',
+            'description': f'Synthetic field number {i}',
+            'datatype': 'xsd:string',
+            'domain': 'crm:E22_Human-Made_Object',
+            'range': 'crm:E41_Appellation',
+            'minOccurs': 0,
+            'maxOccurs': 1,
+            'queries': [
+                {'select': f'SELECT ?value WHERE {{ $subject crm:P1_is_identified_by ?value . ?value rdfs:label "{i}" }}'},
+                {'insert': 'INSERT { $subject crm:P1_is_identified_by $value } WHERE {}'},
+                {'delete': 'DELETE { $subject crm:P1_is_identified_by $value } WHERE {}'},
+            ],
+        }
+        if cardinality > 1:
+            field['domain'] = [f'crm:E{n}_Domain' for n in range(cardinality)]
+            field['range'] = [f'crm:E{n}_Range' for n in range(cardinality)]
+            field['defaultValue'] = [f'default {n}' for n in range(cardinality)]
+            
+        if query_length:
+            field['queries'][0]['select'] = _pad_query(field['queries'][0]['select'], query_length)
+            
+        fields.append(field)
+
+    return {'prefix': FIELD_PREFIX, 'fields': fields}
+
+def synthetic_store(model, flavor=generator.RESEARCHSPACE):
+    """create in-memory Dataset containing the fields of model rendered in flavor."""
+    store = Dataset()
+    store.parse(data=generator.generate(model, flavor), format='trig')
+    return store
+
+
+class CountingStore:
+    """wrapper for store that counts queries and result rows."""
+    def __init__(self, store):
+        self.store = store
+        self.queries = 0
+        self.rows = 0
+
+    def query(self, *args, **kwargs):
+        self.queries += 1
+        res = self.store.query(*args, **kwargs)
+        self.rows += len(res)
+        return res
+
+
+def bench_read_fields(num_fields=1000, cardinality=1, bulk=False, chunk_size=200, native=False):
+    """time parser.read_fields on a synthetic in-memory store.
+    returns dict with number of fields, queries, result rows and time in seconds.
+    """
+    dataset = synthetic_store(synthetic_model(num_fields, cardinality=cardinality))
+    # the native path walks the Dataset without queries
+    store = dataset if native else CountingStore(dataset)
+    start = time.perf_counter()
+    fields = parser.read_fields(store, parser.RESEARCHSPACE, field_id_prefix=FIELD_PREFIX,
+                                bulk=bulk, chunk_size=chunk_size, native=native)
+    elapsed = time.perf_counter() - start
+    if native:
+        return {'fields': len(fields), 'queries': 0, 'rows': 0, 'seconds': elapsed}
+    return {'fields': len(fields), 'queries': store.queries, 'rows': store.rows, 'seconds': elapsed}
+
+
+def _measure(func, *args, **kwargs):
+    """call func with args twice: timed without and then with tracing of the peak memory use
+    (tracemalloc slows down allocations).
+    returns tuple of result, time in seconds and peak memory in bytes.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+def _write_stream(output, model):
+    with open(os.devnull, 'w') as f:
+        for chunk in generator.iter_generate(model, output):
+            f.write(chunk)
+
+def bench_generate(num_fields=10000, output=generator.RESEARCHSPACE, splitFields=False, stream=False,
+                   cardinality=1, query_length=None):
+    """time generator.generate (or generator.iter_generate written to /dev/null if stream)
+    on a synthetic model and trace peak memory use.
+    returns dict with number of fields, time in seconds and peak memory in bytes.
+    """
+    model = synthetic_model(num_fields, cardinality=cardinality, query_length=query_length)
+    generator.precompile([output])
+    if stream:
+        _, elapsed, peak = _measure(_write_stream, output, model)
+    else:
+        _, elapsed, peak = _measure(generator.generate, model, output, splitFields=splitFields)
+    return {'fields': num_fields, 'seconds': elapsed, 'peak_bytes': peak}
+
+def bench_nquads(num_fields=10000, output=generator.RESEARCHSPACE):
+    """time rdf_generator.generate on a synthetic model and trace peak memory use.
+    returns dict with number of fields, time in seconds and peak memory in bytes.
+    """
+    model = synthetic_model(num_fields)
+    _, elapsed, peak = _measure(rdf_generator.generate, model, output)
+    return {'fields': num_fields, 'seconds': elapsed, 'peak_bytes': peak}
+
+def bench_deepcopy(num_fields=10000):
+    """trace peak memory of a deep copy of a synthetic model (as used by generate before 1.6)."""
+    model = synthetic_model(num_fields)
+    _, _, peak = _measure(copy.deepcopy, model)
+    return {'fields': num_fields, 'peak_bytes': peak}
+
+def bench_load_yaml(num_fields=10000, cardinality=1, query_length=None, files=1):
+    """time generator.loadSourceFromFile on a synthetic model written to files YAML files
+    and trace peak memory use.
+    returns dict with number of fields, time in seconds and peak memory in bytes.
+    """
+    model = synthetic_model(num_fields, cardinality=cardinality, query_length=query_length)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        size = -(-num_fields // files)
+        for n in range(files):
+            with open(Path(tmpdir) / f'fields{n:04d}.yml', 'w') as f:
+                part = {'prefix': model['prefix'], 'fields': model['fields'][n * size:(n + 1) * size]}
+                yaml.dump(part, f, Dumper=parser.YamlDumper)
+
+        path = tmpdir if files > 1 else Path(tmpdir) / 'fields0000.yml'
+        source, elapsed, peak = _measure(generator.loadSourceFromFile, str(path))
+        return {'fields': len(source['fields']), 'seconds': elapsed, 'peak_bytes': peak}
+
+def _read_trig(path, flavor):
+    return parser.read_fields(parser.read_trig_store(path), flavor, field_id_prefix=FIELD_PREFIX)
+
+def bench_trig_roundtrip(num_fields=10000, output=generator.RESEARCHSPACE, splitFields=False,
+                         cardinality=1, query_length=None):
+    """write synthetic model as TriG file(s) in flavor output and time parser.read_trig_store
+    and parser.read_fields on the file(s) and trace peak memory use.
+    returns dict with number of fields read, time in seconds and peak memory in bytes.
+    """
+    model = synthetic_model(num_fields, cardinality=cardinality, query_length=query_length)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if splitFields:
+            path = tmpdir
+            for n, (field_id, output_trig) in enumerate(generator.generate(model, output, splitFields=True)):
+                (Path(tmpdir) / f'field{n}.trig').write_text(output_trig)
+        else:
+            path = Path(tmpdir) / 'fields.trig'
+            path.write_text(generator.generate(model, output))
+
+        fields, elapsed, peak = _measure(_read_trig, str(path), output)
+        return {'fields': len(fields), 'seconds': elapsed, 'peak_bytes': peak}
+
+def bench_import_time(action='cli'):
+    """measure the import time of the modules of a command line action with python -X importtime
+    in a new process.
+    returns dict with number of imported modules and import time in seconds.
+    """
+    code = '; '.join(f'import {module}' for module in ACTION_IMPORTS[action])
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    # lines: import time: self [us] | cumulative | imported package
+    self_times = [int(line.split(':', 1)[1].split('|')[0]) for line in res.stderr.splitlines()
+                  if line.startswith('import time:') and 'self' not in line]
+    return {'modules': len(self_times), 'seconds': sum(self_times) / 1e6}
+
+def run_suite(num_fields=1000, cardinality=1, query_length=None, outputs=None):
+    """run the benchmark suite: import time of the command line actions, YAML loading,
+    rendering per flavor (split and unsplit) and TriG round trip read (RS and MP flavors).
+    returns dict with environment, parameters and list of results (JSON serializable).
+    """
+    if outputs is None:
+        outputs = list(FLAVOR_NAMES.keys())
+        
+    params = {'fields': num_fields, 'cardinality': cardinality, 'query_length': query_length}
+    results = []
+    def _add(benchmark, res, **kwargs):
+        logging.info(f"benchmark {benchmark} {kwargs}: {res['seconds']:.3f}s")
+        results.append({'benchmark': benchmark, **kwargs, **res})
+        
+    for action in ACTION_IMPORTS:
+        _add('import_time', bench_import_time(action), action=action)
+    for files in [1, 10]:
+        _add('load_yaml', bench_load_yaml(num_fields, cardinality, query_length, files=files), files=files)
+    for output in outputs:
+        for splitFields in [False, True]:
+            res = bench_generate(num_fields, output, splitFields=splitFields, cardinality=cardinality,
+                                 query_length=query_length)
+            _add('generate', res, flavor=FLAVOR_NAMES[output], split=splitFields)
+    for output in outputs:
+        if output in (generator.RESEARCHSPACE, generator.METAPHACTS):
+            for splitFields in [False, True]:
+                res = bench_trig_roundtrip(num_fields, output, splitFields=splitFields, cardinality=cardinality,
+                                           query_length=query_length)
+                _add('trig_roundtrip', res, flavor=FLAVOR_NAMES[output], split=splitFields)
+
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'version': generator.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': params,
+        'results': results,
+    }
+
+
+def main(num_fields=1000):
+    logging.basicConfig(level='ERROR')
+    res = bench_deepcopy(num_fields * 10)
+    print(f"deepcopy: {res['fields']} fields, peak {res['peak_bytes'] / 2**20:.1f}MiB")
+    for splitFields, stream in [(False, False), (True, False), (False, True)]:
+        res = bench_generate(num_fields * 10, splitFields=splitFields, stream=stream)
+        print(f"generate splitFields={splitFields} stream={stream}: {res['fields']} fields, "
+              + f"{res['seconds']:.2f}s, peak {res['peak_bytes'] / 2**20:.1f}MiB")
+    res = bench_generate(num_fields * 10, output=generator.JSON)
+    print(f"generate JSON: {res['fields']} fields, {res['seconds']:.2f}s, peak {res['peak_bytes'] / 2**20:.1f}MiB")
+    for output in [generator.RESEARCHSPACE, generator.UNIVERSAL]:
+        res = bench_generate(num_fields * 10, output=output)
+        print(f"generate TriG output={output}: {res['fields']} fields, {res['seconds']:.2f}s, "
+              + f"peak {res['peak_bytes'] / 2**20:.1f}MiB")
+        res = bench_nquads(num_fields * 10, output=output)
+        print(f"generate N-Quads output={output}: {res['fields']} fields, {res['seconds']:.2f}s, "
+              + f"peak {res['peak_bytes'] / 2**20:.1f}MiB")
+
+    for cardinality in [1, 5]:
+        for bulk, native in [(False, False), (True, False), (False, True)]:
+            res = bench_read_fields(num_fields, cardinality=cardinality, bulk=bulk, native=native)
+            print(f"read_fields cardinality={cardinality} bulk={bulk} native={native}: {res['fields']} fields, "
+                  + f"{res['queries']} queries, {res['rows']} rows, {res['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,26 @@
-import copy
 import yaml
 import logging
+import hashlib
+import json
+import pickle
+import tempfile
+import os
+import importlib.util
 from pathlib import Path
-from pybars import Compiler
+from SemanticFieldDefinitionGenerator import stats
+# pybars (slow to import) and concurrent.futures are imported when they are used
+
+try:
+    # use fast libyaml parser if available
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+try:
+    # use fast JSON serializer if available
+    import orjson
+except ImportError:
+    orjson = None
 
 __version__ = '1.3'
 
@@ -12,97 +30,404 @@ METAPHACTS = 2
 JSON = 3
 INLINE = 4
 
-def loadSourceFromFile(file):
+TEMPLATE_FILES = {
+    UNIVERSAL: 'universal.handlebars',
+    RESEARCHSPACE: 'researchspace.handlebars',
+    METAPHACTS: 'metaphacts.handlebars',
+}
+
+# flavors generated as JSON without templates
+JSON_OUTPUTS = (JSON, INLINE)
+# query types and names of the JSON pattern attributes
+JSON_QUERY_TYPES = ['autosuggestion', 'insert', 'select', 'ask', 'delete', 'valueSet']
+JSON_TREE_PATTERNS = ['type', 'rootsQuery', 'childrenQuery', 'parentsQuery', 'searchQuery',
+                      'schemePattern', 'relationPattern']
+# (header, separator, footer) of JSON flavors
+JSON_FRAMES = {
+    JSON: ('[\n', ',\n', '\n]\n'),
+    INLINE: ('', '', ''),
+}
+
+FIELDS_BLOCK_START = '{{#each fields}}'
+FIELDS_BLOCK_END = '{{/each}}'
+
+# compiled templates: (output, template file, parts) -> (mtime, template)
+_templates = {}
+# template of parallel worker process
+_workerTemplate = None
+
+def _loadYamlFile(fn):
+    logging.debug(f"reading yaml file {fn}")
+    try:
+        with open(fn, 'r') as f:
+            return yaml.load(f, Loader=YamlLoader)
+        
+    except Exception as e:
+        raise Exception(f"Could not read {fn}: {e}")
+
+def _loadYamlFiles(files, workers=None, cacheFile=None):
+    # return list of parsed sources of files, using and updating cacheFile
+    cache = {}
+    if cacheFile and Path(cacheFile).exists():
+        try:
+            with open(cacheFile, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable YAML cache file {cacheFile}: {e}")
+            
+    # cache key: path -> (mtime, size)
+    keys = {}
+    for fn in files:
+        stat = fn.stat()
+        keys[str(fn)] = (stat.st_mtime_ns, stat.st_size)
+
+    changed = [fn for fn in files if cache.get(str(fn), (None,))[0] != keys[str(fn)]]
+    logging.debug(f"parsing {len(changed)} of {len(files)} yaml files")
+    stats.count('yaml_files_parsed', len(changed))
+    stats.count('yaml_files_cached', len(files) - len(changed))
+    if workers and workers > 1 and len(changed) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            sources = list(executor.map(_loadYamlFile, changed, chunksize=max(1, len(changed) // (workers * 4))))
+    else:
+        sources = [_loadYamlFile(fn) for fn in changed]
+        
+    for fn, source in zip(changed, sources):
+        cache[str(fn)] = (keys[str(fn)], source)
+        
+    if cacheFile and (changed or len(cache) != len(keys)):
+        # keep only current files
+        cache = {key: cache[key] for key in keys}
+        with open(cacheFile, 'wb') as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            
+    return [cache[str(fn)][1] for fn in files]
+
+def loadSourceFromFile(file, workers=None, cacheFile=None):
+    """load field definitions from YAML file or directory of *.yml files.
+    workers: number of processes to parse the files of a directory in parallel
+    cacheFile: optional file to cache parsed files (by path, mtime and size)
+    """
+    with stats.phase('yaml_load'):
+        return _loadSource(file, workers, cacheFile)
+
+def _loadSource(file, workers, cacheFile):
     try:
         p = Path(file)
         if p.is_dir():
-            fields = []
-            prefix = None
-            for fn in p.glob('*.yml'):
-                logging.debug(f"reading yaml file {fn}")
-                with open (fn, 'r') as f:
-                    new_source = yaml.safe_load(f.read())
-                    fields.extend(new_source['fields'])
-                    new_prefix = new_source['prefix']
-                    if new_prefix:
-                        if new_prefix != prefix:
-                            if prefix is not None:
-                                raise Exception(f"YAML files have different prefixes: {prefix} vs {new_prefix}")
-                            else:
-                                prefix = new_prefix
-            
-            source = {'fields': fields}
-            if prefix:
-                source['prefix'] = prefix
-            return source
+            files = list(p.glob('*.yml'))
+            return _mergeSources(files, _loadYamlFiles(files, workers=workers, cacheFile=cacheFile))
     
         else:
-            with open (file, 'r') as f:
-                source = yaml.safe_load(f.read())
-                return source
+            return _loadYamlFiles([p], cacheFile=cacheFile)[0]
 
     except Exception as e:
         raise Exception(f"Could not read {file}: {e}")
 
-def _checkSource(source):
+def _mergeSources(files, sources):
+    # return source with the fields of the sources of files (all with the same prefix)
+    fields = []
+    prefix = None
+    for fn, new_source in zip(files, sources):
+        fields.extend(new_source['fields'])
+        new_prefix = new_source['prefix']
+        if new_prefix:
+            if new_prefix != prefix:
+                if prefix is not None:
+                    raise Exception(f"YAML files have different prefixes: {prefix} vs {new_prefix} in {fn}")
+                else:
+                    prefix = new_prefix
+    
+    source = {'fields': fields}
+    if prefix:
+        source['prefix'] = prefix
+    return source
+
+def _processField(field):
+    # return shallow copy of field with list attributes
+    # (the source field and its values are not modified)
+    field = dict(field)
     # make sure some attributes are lists
-    for field in source['fields']:
-        for att in ['domain', 'range', 'defaultValue']:
-            if att in field and not isinstance(field[att], list):
-                logging.debug(f"Wrapping single value in Field attribute '{att}' in list.")
-                field[att] = [field[att]]
+    for att in ['domain', 'range', 'defaultValue']:
+        if att in field and not isinstance(field[att], list):
+            logging.debug(f"Wrapping single value in Field attribute '{att}' in list.")
+            field[att] = [field[att]]
 
-    return source
+    return field
 
-def generate(source, output=UNIVERSAL, splitFields=False, add_ns_prefix=None):
-    if output == METAPHACTS:
-        templateFile = Path(__file__).parent / './templates/metaphacts.handlebars'
-    elif output == RESEARCHSPACE:
-        templateFile = Path(__file__).parent / './templates/researchspace.handlebars'
-    elif output == JSON:
-        templateFile = Path(__file__).parent / './templates/json.handlebars'
-    elif output == INLINE:
-        templateFile = Path(__file__).parent / './templates/inline.handlebars'
-    else:
-        templateFile = Path(__file__).parent / './templates/universal.handlebars'
+def _hasValue(value):
+    return value is not None and value != '' and value != []
+
+def _jsonString(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+def _jsonField(field, prefix):
+    # return dict of field in JSON flavor
+    field = _processField(field)
+    obj = {'id': field['id']}
+    for att in ['label', 'description', 'display', 'minOccurs', 'maxOccurs', 'order']:
+        if _hasValue(field.get(att)):
+            obj[att] = _jsonString(field[att])
+    if _hasValue(field.get('defaultValue')):
+        obj['defaultValue'] = field['defaultValue']
+    if _hasValue(field.get('datatype')):
+        obj['xsdDatatype'] = field['datatype']
+    for att in ['domain', 'range']:
+        if _hasValue(field.get(att)):
+            obj[att] = field[att]
+    if field.get('treePatterns'):
+        obj['treePatterns'] = {key: field['treePatterns'][key] for key in JSON_TREE_PATTERNS
+                               if _hasValue(field['treePatterns'].get(key))}
+    for queries in field.get('queries') or []:
+        for queryType in JSON_QUERY_TYPES:
+            if queries.get(queryType):
+                obj[queryType + 'Pattern'] = queries[queryType]
+    obj['iri'] = prefix + field['id']
+    return obj
+
+def _dumpJson(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=str)
+
+def _renderJsonField(output, prefix, field):
+    try:
+        with stats.phase('render'):
+            fieldJson = _dumpJson(_jsonField(field, prefix))
+    except Exception as e:
+        raise Exception(f"Could not generate definition of field {field.get('id')}: {e}")
+    if output == INLINE:
+        # backend template partial
+        return f"[[#*inline \"{field['id']}\"]]\n{fieldJson}\n[[/inline]]\n"
+    return fieldJson
+
+def _iterGenerateJson(source, output):
+    # yield JSON output in chunks: header, one chunk per field, footer
+    prefix = source.get('prefix', '')
+    header, separator, footer = JSON_FRAMES[output]
+    yield header
+    for index, field in enumerate(source['fields']):
+        chunk = _renderJsonField(output, prefix, field)
+        yield separator + chunk if index > 0 else chunk
+    yield footer
+
+def _templateFile(output):
+    return Path(__file__).parent / 'templates' / TEMPLATE_FILES.get(output, TEMPLATE_FILES[UNIVERSAL])
+
+def _preparedCompiler():
+    # Compiler for template parts that already had their whitespace processed
+    from pybars import Compiler
+    compiler = Compiler()
+    compiler.whitespace_control = lambda source: source
+    return compiler
+
+def _fieldHelper(this, options):
+    # render the block in the scope of the current field as in {{#each fields}}
+    import pybars
+    index = this.get('index')
+    scope = pybars.Scope(this.get('field'), this, options['root'],
+                         index=index, first=index == 0, last=this.get('last'))
+    return options['fn'](scope)
+
+TEMPLATE_HELPERS = {'field': _fieldHelper}
+
+def _compileTemplate(templateSource, name, templateCacheDir=None, compiler=None):
+    import pybars
+    if compiler is None:
+        compiler = pybars.Compiler()
+
+    if not templateCacheDir:
+        logging.debug(f"compiling template {name}")
+        with stats.phase('template_compile'):
+            return compiler.compile(templateSource)
+    
+    # use generated template module from cache directory (Python caches its bytecode)
+    digest = hashlib.sha1((pybars.__version__ + templateSource).encode('utf-8')).hexdigest()[:16]
+    moduleName = f"{name}_{digest}"
+    moduleFile = Path(templateCacheDir) / f"{moduleName}.py"
+    if not moduleFile.exists():
+        logging.debug(f"compiling template {name} to {moduleFile}")
+        moduleFile.parent.mkdir(parents=True, exist_ok=True)
+        # unique temporary file: workers and other processes may compile the same template
+        with tempfile.NamedTemporaryFile('w', dir=moduleFile.parent, prefix=f"{moduleName}.", suffix='.tmp',
+                                         delete=False) as f:
+            with stats.phase('template_compile'):
+                f.write(compiler.precompile(templateSource))
+        os.replace(f.name, moduleFile)
+
+    logging.debug(f"loading template module {moduleFile}")
+    with stats.phase('template_load'):
+        spec = importlib.util.spec_from_file_location(f"_template_{moduleName}", moduleFile)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module.render
+
+def _compileTemplateParts(templateSource, name, templateCacheDir=None):
+    # split template at the {{#each fields}} block after whitespace processing
+    # so that the parts render exactly like the complete template
+    from pybars import Compiler
+    compiler = _preparedCompiler()
+    source = Compiler().whitespace_control(templateSource)
+    start = source.index(FIELDS_BLOCK_START)
+    end = source.rindex(FIELDS_BLOCK_END)
+    header = source[:start]
+    field = '{{#field}}' + source[start + len(FIELDS_BLOCK_START):end] + '{{/field}}'
+    footer = source[end + len(FIELDS_BLOCK_END):]
+    return (_compileTemplate(header, f"{name}_header", templateCacheDir, compiler),
+            _compileTemplate(field, f"{name}_field", templateCacheDir, compiler),
+            _compileTemplate(footer, f"{name}_footer", templateCacheDir, compiler))
+
+def getTemplate(output=UNIVERSAL, templateCacheDir=None, parts=False):
+    """return compiled template for output flavor.
+    templates are cached per process and recompiled when the template file changes.
+    templateCacheDir: optional directory to store generated template code across processes
+    parts: return tuple of (header, field, footer) templates to render single fields
+    (render field with {'prefix', 'extra_ns', 'field', 'index', 'last'} and helpers=TEMPLATE_HELPERS)
+    """
+    templateFile = _templateFile(output)
+    mtime = templateFile.stat().st_mtime_ns
+    key = (output, str(templateFile), parts)
+    cached = _templates.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
     
     with templateFile.open() as f:
         templateSource = f.read()
 
-    processedSource = _checkSource(copy.deepcopy(source))
+    if parts:
+        template = _compileTemplateParts(templateSource, templateFile.stem, templateCacheDir)
+    else:
+        template = _compileTemplate(templateSource, templateFile.stem, templateCacheDir)
         
-    if output == JSON or output == INLINE:
-        for i in range(len(source['fields'])):
-            if 'queries' in source['fields'][i]:
-                for queryIndex, query in enumerate(source['fields'][i]['queries']):
-                    for queryType in query.keys():
-                        escapedQuery = source['fields'][i]['queries'][queryIndex][queryType].replace('"','\\"')
-                        processedSource['fields'][i]['queries'][queryIndex][queryType] = escapedQuery
-            if 'treePatterns' in source['fields'][i]:
-                for key, value in source['fields'][i]['treePatterns'].items():
-                    escapedValue = value.replace('"','\\"')
-                    processedSource['fields'][i]['treePatterns'][key] = escapedValue
+    _templates[key] = (mtime, template)
+    return template
 
-    compiler = Compiler()
-    template = compiler.compile(templateSource)
+def precompile(outputs=None, templateCacheDir=None):
+    """compile and cache templates for list of output flavors (default all, JSON flavors use no templates)."""
+    if outputs is None:
+        outputs = TEMPLATE_FILES.keys()
+    else:
+        outputs = [output for output in outputs if output not in JSON_OUTPUTS]
+        
+    for output in outputs:
+        # complete template for split fields, parts for iter_generate
+        getTemplate(output, templateCacheDir)
+        getTemplate(output, templateCacheDir, parts=True)
+
+def _renderField(template, output, prefix, field, add_ns_prefix):
+    # create new source for field
+    fieldSource = {'prefix': prefix, 'fields': [_processField(field)], 'extra_ns': add_ns_prefix}
+    with stats.phase('render'):
+        return (prefix + field['id'], template(fieldSource))
+
+def _initWorker(output, templateCacheDir):
+    global _workerTemplate
+    _workerTemplate = getTemplate(output, templateCacheDir)
+
+def _renderWorkerField(args):
+    return _renderField(_workerTemplate, *args)
+
+def _generateParallel(fields, prefix, output, add_ns_prefix, templateCacheDir, workers):
+    chunksize = max(1, min(64, len(fields) // (workers * 4)))
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                             initargs=(output, templateCacheDir)) as executor:
+        tasks = ((output, prefix, field, add_ns_prefix) for field in fields)
+        results = executor.map(_renderWorkerField, tasks, chunksize=chunksize)
+        try:
+            while True:
+                try:
+                    result = next(results)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    raise Exception("Could not generate definitions") from e
+                yield result
+        finally:
+            # cancel pending tasks if closed early
+            results.close()
+
+def fieldHashes(source, output=UNIVERSAL, add_ns_prefix=None, renderer=None):
+    """return dict of field ids (with prefix) and hashes of the field content, output flavor,
+    add_ns_prefix and renderer version to detect fields that need to be generated again.
+    renderer: module that generates the output (default this module, e.g. rdf_generator)
+    """
+    if renderer is None or renderer.__name__ == __name__:
+        # template or JSON serialization of this module
+        rendererName = __name__
+        rendererFile = Path(__file__) if output in JSON_OUTPUTS else _templateFile(output)
+    else:
+        rendererName = renderer.__name__
+        rendererFile = Path(renderer.__file__)
+    rendererDigest = hashlib.sha1(rendererFile.read_bytes()).hexdigest()
+
+    settings = json.dumps([__version__, rendererName, rendererDigest, output, add_ns_prefix], sort_keys=True,
+                          default=str)
+    prefix = source.get('prefix', '')
+    hashes = {}
+    for field in source['fields']:
+        content = json.dumps([settings, prefix, field], sort_keys=True, default=str)
+        hashes[prefix + field['id']] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        
+    return hashes
+
+def _renderPart(template, context, **kwargs):
+    # render template part (errors are raised outside of the yield of iter_generate)
     try:
-        if splitFields:
-            outputs = []
-            prefix = processedSource.get('prefix', '')
-            for field in processedSource['fields']:
-                # create new source for each field
-                fieldId = field['id']
-                fieldSource = {'prefix': prefix, 'fields': [field], 'extra_ns': add_ns_prefix}
-                fieldOutput = template(fieldSource)
-                # add id,output pair to list
-                outputs.append((prefix + fieldId, fieldOutput))
-                
-            return outputs
+        return template(context, **kwargs)
+    except Exception as e:
+        raise Exception("Could not generate definitions") from e
 
-        else:
-            processedSource['extra_ns'] = add_ns_prefix
-            output = template(processedSource)
-            return output
+def iter_generate(source, output=UNIVERSAL, add_ns_prefix=None, templateCacheDir=None):
+    """generate field definitions in output flavor from source.
+    yields the output in chunks: header, one chunk per field, footer.
+    """
+    if output in JSON_OUTPUTS:
+        yield from _iterGenerateJson(source, output)
+        return
+
+    header, fieldTemplate, footer = getTemplate(output, templateCacheDir, parts=True)
+    prefix = source.get('prefix', '')
+    fields = source['fields']
+    yield _renderPart(header, {'prefix': prefix, 'extra_ns': add_ns_prefix})
+    last = len(fields) - 1
+    for index, field in enumerate(fields):
+        fieldSource = {'prefix': prefix, 'extra_ns': add_ns_prefix, 'field': _processField(field),
+                       'index': index, 'last': index == last}
+        with stats.phase('render'):
+            chunk = _renderPart(fieldTemplate, fieldSource, helpers=TEMPLATE_HELPERS)
+        yield chunk
+        
+    yield _renderPart(footer, {'prefix': prefix, 'extra_ns': add_ns_prefix})
+
+def generate(source, output=UNIVERSAL, splitFields=False, add_ns_prefix=None, templateCacheDir=None, workers=None):
+    """generate field definitions in output flavor from source.
+    returns output string or list of (field id, output) tuples if splitFields.
+    workers: number of processes to render split fields in parallel
+    (returns iterator of (field id, output) tuples in source order)
+    """
+    if not splitFields:
+        return ''.join(iter_generate(source, output, add_ns_prefix=add_ns_prefix, templateCacheDir=templateCacheDir))
+    
+    prefix = source.get('prefix', '')
+    if output in JSON_OUTPUTS:
+        header, _, footer = JSON_FRAMES[output]
+        return [(prefix + field['id'], header + _renderJsonField(output, prefix, field) + footer)
+                for field in source['fields']]
+
+    if workers and workers > 1:
+        return _generateParallel(source['fields'], prefix, output, add_ns_prefix, templateCacheDir, workers)
+
+    template = getTemplate(output, templateCacheDir)
+    try:
+        outputs = []
+        for field in source['fields']:
+            # add id,output pair to list
+            outputs.append(_renderField(template, output, prefix, field, add_ns_prefix))
+            
+        return outputs
     except:
         raise Exception("Could not generate definitions")
 
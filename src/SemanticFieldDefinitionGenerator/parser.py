@@ -1,10 +1,27 @@
-from rdflib import Dataset, URIRef
-from rdflib.namespace import Namespace, NamespaceManager
-from rdflib.plugins.stores.sparqlstore import SPARQLStore
+from SemanticFieldDefinitionGenerator import stats
+from rdflib import Dataset, URIRef, BNode, RDF
+from rdflib.namespace import Namespace, NamespaceManager, split_uri
+from rdflib.query import Result
+from collections import namedtuple
+from rdflib.plugins.stores.sparqlstore import SPARQLStore, SPARQLUpdateStore
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from io import BytesIO
+import threading
+import pickle
+import os
+import time
 import yaml
 import logging
-from urllib.parse import urlencode, quote_plus
+
+try:
+    # use fast libyaml emitter if available
+    from yaml import CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+from urllib.parse import urlencode, urlsplit, quote_plus
 
 __version__ = '1.3'
 
@@ -29,56 +46,189 @@ mpFieldConNs = Namespace('http://www.metaphacts.com/ontologies/platform#')
 # used prefixes, add chosen flavor of field*NS later
 nsPrefixes = {'rdfs': rdfsNs, 'ldp': ldpNs, 'sp': spNs, 'crm': crmNs}
 
-# separate NamespaceManager for normalizations
+# separate NamespaceManager for normalizations (created on first use by _ns_manager)
 # rdflib BUG: queries may break when you use the store's manager :-(
-nsManager = NamespaceManager(Dataset())
-for pref, ns in nsPrefixes.items():
-    nsManager.bind(pref, ns)
+_nsManager = None
+
+def _ns_manager():
+    """return NamespaceManager for normalizations."""
+    global _nsManager
+    if _nsManager is None:
+        manager = NamespaceManager(Dataset())
+        for pref, ns in nsPrefixes.items():
+            manager.bind(pref, ns)
+        _nsManager = manager
+        
+    return _nsManager
+
+def __getattr__(name):
+    # module attribute nsManager is created lazily
+    if name == 'nsManager':
+        return _ns_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# field attributes: (attribute name, property, multiple values, URI values)
+FIELD_ATTRIBUTES = [
+    ('label', 'rdfs:label', False, False),
+    ('description', 'rdfs:comment', False, False),
+    ('domain', 'fielddef:domain', True, True),
+    ('range', 'fielddef:range', True, True),
+    ('datatype', 'fielddef:xsdDatatype', False, True),
+    ('minOccurs', 'fielddef:minOccurs', False, False),
+    ('maxOccurs', 'fielddef:maxOccurs', False, False),
+    ('order', 'fielddef:order', False, False),
+    ('defaultValue', 'fielddef:defaultValue', True, False),
+]
+# field query attributes: (query type, property of sp:Query)
+FIELD_QUERIES = [
+    ('select', 'fielddef:selectPattern'),
+    ('insert', 'fielddef:insertPattern'),
+    ('delete', 'fielddef:deletePattern'),
+    ('ask', 'fielddef:askPattern'),
+    ('autosuggestion', 'fielddef:autosuggestionPattern'),
+    ('valueSet', 'fielddef:valueSetPattern'),
+]
+
+# graph pattern matching all attribute ?property ?value pairs of ?field in ?graph
+# (one row per value, avoiding the cross-product of multiple OPTIONAL values)
+FIELD_PATTERN = f'''GRAPH ?graph {{
+            {{
+                VALUES ?property {{ {' '.join(prop for _, prop, _, _ in FIELD_ATTRIBUTES)} }}
+                ?field ?property ?value .
+            }} UNION {{
+                VALUES ?property {{ {' '.join(prop for _, prop in FIELD_QUERIES)} }}
+                ?field ?property ?pattern .
+                ?pattern sp:text ?value .
+            }}
+        }}'''
 
 
-def _uristr(node):
-    """return string form of node, normalizing URIs.""" 
+def _namespace_table(add_ns_prefix=None):
+    """return dict of namespace and prefix for the normalization of URIs
+    (the namespaces of the NamespaceManager and add_ns_prefix).
+    """
+    prefixes = {pref: str(ns) for pref, ns in _ns_manager().namespaces()}
+    if add_ns_prefix:
+        prefixes.update((pref, str(ns)) for pref, ns in add_ns_prefix.items())
+        
+    return {ns: pref for pref, ns in prefixes.items()}
+
+@lru_cache(maxsize=4096)
+def _split_uri(uri):
+    """return tuple of namespace and local name of uri or None if it can not be split."""
+    try:
+        return split_uri(uri)
+    except ValueError:
+        return None
+
+def _uristr(node, namespaces=None):
+    """return string form of node, normalizing URIs.
+    namespaces: dict of namespace and prefix (default _namespace_table())
+    """ 
     if isinstance(node, URIRef):
         # normalize to N3 form including namespaces
-        return node.n3(nsManager)
+        if namespaces is None:
+            namespaces = _namespace_table()
+        parts = _split_uri(str(node))
+        if parts is not None and parts[0] in namespaces:
+            return f"{namespaces[parts[0]]}:{parts[1]}"
+        
+        return f"<{node}>"
         
     return str(node)
 
-def _set_once(items, key, value):
-    """set items[key] to value if it doesn't exist, warn if value is different."""
-    if key in items:
-        if items[key] != value:
-            logging.warning(f"Ignoring different value to set! key={key} value={value}")
-        
-    else:
-        items[key] = value
-        
-    return items
-
-def _set_append(items, key, value):
-    """set items[key] to value if it doesn't exist, append to list if value is different."""
-    if key in items:
-        oldval = items[key]
-        if oldval != value:
-            # existing value is different
-            if isinstance(oldval, list):
-                # append to existing list
-                oldval.append(value)
+# ?property ?value row of field attributes
+_FieldRow = namedtuple('_FieldRow', ['property', 'value'])
+
+def _resolve(prefixes, name):
+    """return URIRef for prefixed name using prefixes."""
+    pref, local = name.split(':', 1)
+    return URIRef(prefixes[pref] + local)
+
+
+class PooledSPARQLStore(SPARQLStore):
+    """SPARQLStore that keeps a persistent HTTP connection per thread
+    and retries queries after server errors (5xx), timeouts and connection errors.
+    """
+    # use POST for queries that make longer URLs
+    max_get_length = 4000
+
+    def __init__(self, query_endpoint, max_retries=3, backoff=0.5, timeout=60, **kwargs):
+        super().__init__(query_endpoint=query_endpoint, **kwargs)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._url = urlsplit(query_endpoint)
+        self._local = threading.local()
+
+    def _connection(self, reset=False):
+        """return HTTP connection of current thread (new connection if reset)."""
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None and reset:
+            conn.close()
+            conn = None
+            
+        if conn is None:
+            if self._url.scheme == 'https':
+                conn = HTTPSConnection(self._url.netloc, timeout=self.timeout)
             else:
-                # create new list
-                items[key] = [oldval, value]
-        
-    else:
-        items[key] = value
-        
-    return items
+                conn = HTTPConnection(self._url.netloc, timeout=self.timeout)
+            self._local.connection = conn
+            
+        return conn
+
+    def _query(self, query, default_graph=None, named_graph=None):
+        self._queries += 1
+        params = dict(self.kwargs.get('params') or {})
+        if default_graph is not None and not isinstance(default_graph, BNode):
+            params['default-graph-uri'] = default_graph
+            
+        headers = dict(self.kwargs.get('headers') or {})
+        headers['Accept'] = self.response_mime_types()
+        path = self._url.path + '?' + (self._url.query + '&' if self._url.query else '')
+        params['query'] = query
+        query_params = urlencode(params)
+        if len(path) + len(query_params) <= self.max_get_length:
+            method, path, body = 'GET', path + query_params, None
+        else:
+            method, body = 'POST', query_params.encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                conn = self._connection(reset=attempt > 0)
+                conn.request(method, path, body=body, headers=headers)
+                res = conn.getresponse()
+                data = res.read()
+                if res.status < 300:
+                    content_type = (res.getheader('Content-Type') or '').split(';')[0]
+                    return Result.parse(BytesIO(data), content_type=content_type)
+                
+                if res.status < 500:
+                    raise ValueError(f"SPARQL query failed: {res.status} {res.reason}")
+                
+                error = f"{res.status} {res.reason}"
+                
+            except (OSError, HTTPException) as e:
+                error = repr(e)
+
+            if attempt < self.max_retries:
+                stats.count('sparql_retries')
+                delay = self.backoff * 2 ** attempt
+                logging.warning(f"SPARQL query failed ({error}), retrying in {delay}s")
+                time.sleep(delay)
+                
+        raise Exception(f"SPARQL query failed after {self.max_retries + 1} attempts: {error}")
 
 
-def open_sparql_store(endpoint, repository='assets', auth_user='admin', auth_pass='admin'):
+def open_sparql_store(endpoint, repository='assets', auth_user='admin', auth_pass='admin', pooled=False, max_retries=3,
+                      update=False):
     """open connection to SPARQL store.
     endpoint: SPARQL endpoint URI
     repository: RS/MP repository parameter
     auth: (username, password) tuple
+    pooled: use PooledSPARQLStore with persistent connections retrying failed queries max_retries times
+    update: use SPARQLUpdateStore that sends SPARQL updates to the endpoint (not pooled)
     returns rdflib Dataset.
     """
     logging.info(f"connecting to SPARQLStore at {endpoint} (repository={repository} user={auth_user} pass={auth_pass})")
@@ -93,38 +243,153 @@ def open_sparql_store(endpoint, repository='assets', auth_user='admin', auth_pas
     else:
         auth = None
         
-    _store = SPARQLStore(query_endpoint=endpoint, params=params, auth=auth)
+    if update:
+        _store = SPARQLUpdateStore(query_endpoint=endpoint, update_endpoint=endpoint, params=params, auth=auth)
+    elif pooled:
+        _store = PooledSPARQLStore(query_endpoint=endpoint, params=params, auth=auth, max_retries=max_retries)
+    else:
+        _store = SPARQLStore(query_endpoint=endpoint, params=params, auth=auth)
     # instantiate Dataset
-    store = Dataset(_store)
+    # (with default union rdflib sends updates unchanged instead of wrapping them in GRAPH blocks)
+    store = Dataset(_store, default_union=update)
     return store
 
-def read_trig_store(pathname):
+def _query(store, query, **kwargs):
+    """run query on store and record its latency."""
+    start = time.perf_counter()
+    res = store.query(query, **kwargs)
+    elapsed = time.perf_counter() - start
+    stats.add_time('query', elapsed)
+    stats.observe('query_latency', elapsed)
+    return res
+
+def _read_trig_quads(filename):
+    """return list of quads in trig file filename."""
+    logging.debug(f"reading trig file {filename}")
+    store = Dataset()
+    store.parse(filename, format='trig')
+    return list(store.quads())
+
+def _read_trig_files(files, workers=None, cache_file=None):
+    """return list of lists of quads in trig files, using and updating cache_file."""
+    cache = {}
+    if cache_file and Path(cache_file).exists():
+        try:
+            with open(cache_file, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable trig cache file {cache_file}: {e}")
+            
+    # cache key: path -> (mtime, size)
+    keys = {}
+    for fn in files:
+        stat = fn.stat()
+        keys[str(fn)] = (stat.st_mtime_ns, stat.st_size)
+
+    changed = [fn for fn in files if cache.get(str(fn), (None,))[0] != keys[str(fn)]]
+    logging.debug(f"parsing {len(changed)} of {len(files)} trig files")
+    stats.count('trig_files_parsed', len(changed))
+    stats.count('trig_files_cached', len(files) - len(changed))
+    if workers and workers > 1 and len(changed) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_read_trig_quads, changed, chunksize=max(1, len(changed) // (workers * 4))))
+    else:
+        results = [_read_trig_quads(fn) for fn in changed]
+        
+    for fn, quads in zip(changed, results):
+        cache[str(fn)] = (keys[str(fn)], quads)
+        
+    if cache_file and (changed or len(cache) != len(keys)):
+        # keep only current files
+        cache = {key: cache[key] for key in keys}
+        with open(cache_file, 'wb') as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+            
+    return [cache[str(fn)][1] for fn in files]
+
+def read_trig_store(pathname, workers=None, cache_file=None):
     """create store by loading trig file(s) from pathname.
+    workers: number of processes to parse the files of a directory in parallel
+    cache_file: optional file to cache parsed quads (by path, mtime and size)
     """
+    with stats.phase('trig_parse'):
+        return _read_trig_store(pathname, workers, cache_file)
+
+def _read_trig_store(pathname, workers, cache_file):
     logging.info(f"creating trig file store from {pathname}")
-    store = Dataset()
     p = Path(pathname)
     if p.is_dir():
-        for f in p.glob('*.trig'):
-            logging.debug(f"reading trig file {f}")
-            store.parse(f, format='trig')
-
+        files = list(p.glob('*.trig'))
     else:
-        logging.debug(f"reading trig file {p}")
-        store.parse(p, format='trig')
+        files = [p]
+        
+    if len(files) == 1 and not cache_file:
+        logging.debug(f"reading trig file {files[0]}")
+        store = Dataset()
+        store.parse(files[0], format='trig')
+        stats.count('trig_files_parsed')
+        return store
+
+    store = Dataset()
+    for quads in _read_trig_files(files, workers=workers, cache_file=cache_file):
+        store.addN(quads)
 
     return store
 
-def read_fields(store, flavor, field_id_prefix=None, add_ns_prefix=None):
+def read_fields(store, flavor, field_id_prefix=None, add_ns_prefix=None, **kwargs):
     """read all fields of given flavor from store.
     returns list of fields as dicts.
+    (see iter_fields for options)
+    """
+    return list(iter_fields(store, flavor, field_id_prefix=field_id_prefix, add_ns_prefix=add_ns_prefix, **kwargs))
+
+def iter_fields(store, flavor, field_id_prefix=None, add_ns_prefix=None, bulk=False, chunk_size=200, native=None,
+                workers=None):
+    """read all fields of given flavor from store.
+    bulk: read attributes of chunk_size fields per query instead of one query per field
+    workers: number of concurrent queries
+    native: read fields by walking the graph instead of SPARQL queries
+    (default: True if store is local, i.e. not a SPARQLStore)
+    yields fields as dicts.
     """
-    fields = []
+    prefixes = _flavor_prefixes(flavor, add_ns_prefix)
+    # namespaces for the normalization of URI values
+    namespaces = _namespace_table(add_ns_prefix)
+    if native is None:
+        native = _is_local(store)
+        
+    if native:
+        yield from iter_fields_native(store, field_id_prefix, prefixes, namespaces=namespaces)
+        return
+
+    res = _field_graphs(store, prefixes, native)
+    if bulk:
+        yield from iter_fields_bulk(store, res, field_id_prefix, prefixes, chunk_size=chunk_size, workers=workers,
+                                    namespaces=namespaces)
+        return
+    
+    def _read(graph_field):
+        graph_uri, field_uri = graph_field
+        logging.debug(f"field uri={field_uri} in graph={graph_uri}")
+        field_id = _field_id(field_uri, field_id_prefix)
+        return read_field(store, field_uri, graph_uri, field_id, prefixes, namespaces=namespaces)
+        
+    if workers and workers > 1:
+        # run queries concurrently (map keeps the order of fields)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for field in executor.map(_read, res):
+                if field is not None:
+                    yield field
+    else:
+        for field in map(_read, res):
+            if field is not None:
+                yield field
+
+def _flavor_prefixes(flavor, add_ns_prefix=None):
+    """return dict of namespace prefixes for queries of fields of flavor."""
+    prefixes = nsPrefixes.copy()
     if add_ns_prefix:
-        prefixes = nsPrefixes.copy()
         prefixes.update(add_ns_prefix)
-    else:
-        prefixes = nsPrefixes
     
     if flavor == METAPHACTS:
         prefixes['fielddef'] = mpFieldDefNs
@@ -132,7 +397,28 @@ def read_fields(store, flavor, field_id_prefix=None, add_ns_prefix=None):
     else:
         prefixes['fielddef'] = rsFieldDefNs
         prefixes['fieldcon'] = rsFieldConNs
+        
+    return prefixes
 
+def _is_local(store):
+    """return if store is local, i.e. not a SPARQLStore."""
+    return not isinstance(getattr(store, 'store', None), SPARQLStore)
+
+def _field_graphs(store, prefixes, native):
+    """return list of (graph, field) URI pairs of the fields in the container in store ordered by field.
+    native: walk the graph instead of using a SPARQL query
+    """
+    if native:
+        container = _resolve(prefixes, 'fieldcon:fieldDefinitionContainer')
+        field_class = _resolve(prefixes, 'fielddef:Field')
+        field_graphs = []
+        for _, _, field_uri, graph_uri in store.quads((container, _resolve(prefixes, 'ldp:contains'), None, None)):
+            if (field_uri, RDF.type, field_class) in store.graph(graph_uri):
+                field_graphs.append((graph_uri, field_uri))
+        
+        field_graphs.sort(key=lambda gf: gf[1])
+        return field_graphs
+    
     query = '''select ?graph ?field
     where {
         graph ?graph {
@@ -142,23 +428,93 @@ def read_fields(store, flavor, field_id_prefix=None, add_ns_prefix=None):
     }
     ORDER BY ?field'''
     logging.debug(f"fields query='{query}'")
-    res = store.query(query, initNs=prefixes)
+    return [(r.graph, r.field) for r in _query(store, query, initNs=prefixes)]
+
+def field_graphs(store, flavor, add_ns_prefix=None, native=None):
+    """return list of (graph, field) URI pairs of all fields of given flavor in store ordered by field.
+    native: walk the graph instead of using a SPARQL query (default: True if store is local)
+    """
+    if native is None:
+        native = _is_local(store)
+        
+    return _field_graphs(store, _flavor_prefixes(flavor, add_ns_prefix), native)
+
+def iter_fields_native(store, field_id_prefix, prefixes, namespaces=None):
+    """read all semantic fields from local store by walking the graph without SPARQL queries.
+    namespaces: dict of namespace and prefix for the normalization of URI values (see _namespace_table)
+    yields fields as dicts.
+    """
+    query_properties = {_resolve(prefixes, prop) for _, prop in FIELD_QUERIES}
+    sp_text = _resolve(prefixes, 'sp:text')
+    properties = _field_properties(prefixes)
+    # find fields in container (ordered by field like the fields query)
+    for graph_uri, field_uri in _field_graphs(store, prefixes, True):
+        logging.debug(f"field uri={field_uri} in graph={graph_uri}")
+        graph = store.graph(graph_uri)
+        rows = []
+        for prop, value in graph.predicate_objects(field_uri):
+            if prop in query_properties:
+                # query text of sp:Query
+                rows.extend(_FieldRow(prop, text) for text in graph.objects(value, sp_text))
+            elif prop in properties:
+                rows.append(_FieldRow(prop, value))
+        
+        field = _read_field_values(rows, _field_id(field_uri, field_id_prefix), properties, namespaces)
+        if field is None:
+            logging.error(f"Field definition not found for URI={field_uri}")
+            continue
+        
+        yield field
+
+def iter_fields_bulk(store, field_graphs, field_id_prefix, prefixes, chunk_size=200, workers=None, namespaces=None):
+    """read the semantic fields in the list of (graph, field) URI pairs field_graphs from store.
+    reads the attributes of chunk_size fields per query and groups the result rows by field.
+    workers: number of concurrent queries
+    namespaces: dict of namespace and prefix for the normalization of URI values (see _namespace_table)
+    yields fields as dicts in the order of field_graphs.
+    """
+    properties = _field_properties(prefixes)
+    if namespaces is None:
+        namespaces = _namespace_table()
+    chunks = [field_graphs[start:start + chunk_size] for start in range(0, len(field_graphs), chunk_size)]
     
-    for r in res:
-        logging.debug(f"field uri={r.field} in graph={r.graph}")
-        field_id = str(r.field)
-        if field_id_prefix and field_id.startswith(field_id_prefix):
-            field_id = field_id[len(field_id_prefix):]
+    def _read(chunk):
+        values = ' '.join(f"({graph.n3()} {field.n3()})" for graph, field in chunk)
+        query = f'''SELECT *
+    WHERE {{
+        VALUES (?graph ?field) {{ {values} }}
+        {FIELD_PATTERN}
+    }}'''
+        logging.debug(f"bulk field query for {len(chunk)} fields prefixes={prefixes}")
+        res = _query(store, query, initNs=prefixes)
+        # group rows by graph and field
+        rows = {}
+        for r in res:
+            rows.setdefault((r.graph, r.field), []).append(r)
+            
+        fields = []
+        for graph, field_uri in chunk:
+            field = _read_field_values(rows.get((graph, field_uri), []), _field_id(field_uri, field_id_prefix), properties,
+                                       namespaces)
+            if field is None:
+                logging.error(f"Field definition not found for URI={field_uri}")
+                continue
             
-        field = read_field(store, r.field, r.graph, field_id, prefixes)
-        if field is not None:
             fields.append(field)
+            
+        return fields
+    
+    if workers and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for fields in executor.map(_read, chunks):
+                yield from fields
+    else:
+        for fields in map(_read, chunks):
+            yield from fields
 
-        #break # debug
-    return fields
-
-def read_field(store, field_uri, graph_uri, field_id, prefixes):
+def read_field(store, field_uri, graph_uri, field_id, prefixes, namespaces=None):
     """read the semantic field with URI field_uri in named graph graph_uri from store.
+    namespaces: dict of namespace and prefix for the normalization of URI values (see _namespace_table)
     returns dict of field attributes.
     
     field attributes (see https://documentation.researchspace.org/resource/Help:SemanticForm)
@@ -180,91 +536,88 @@ def read_field(store, field_uri, graph_uri, field_id, prefixes):
     - valueSetPattern: SPARQL SELECT query string for populating set choices such as in dropdown
     - treePatterns: SPARQL configuration to select terms from an hierarchical thesaurus.
     """
-    query = '''SELECT *
-    WHERE {
-        GRAPH ?graph {
-            ?field rdfs:label ?label .
-            OPTIONAL {
-                ?field rdfs:comment ?description .
-            } OPTIONAL {
-                ?field fielddef:domain ?domain .
-            } OPTIONAL {
-                ?field fielddef:range ?range .
-            } OPTIONAL {
-                ?field fielddef:xsdDatatype ?datatype . 
-            } OPTIONAL {
-                ?field fielddef:minOccurs ?minOccurs . 
-            } OPTIONAL {
-                ?field fielddef:maxOccurs ?maxOccurs . 
-            } OPTIONAL {
-                ?field fielddef:order ?order .
-            } OPTIONAL {
-                ?field fielddef:defaultValue ?defaultValue .
-            } OPTIONAL {
-                ?field fielddef:selectPattern / sp:text ?selectPattern .
-            } OPTIONAL {
-                ?field fielddef:insertPattern / sp:text ?insertPattern .
-            } OPTIONAL {
-                ?field fielddef:deletePattern / sp:text ?deletePattern .
-            } OPTIONAL {
-                ?field fielddef:askPattern / sp:text ?askPattern .
-            } OPTIONAL {
-                ?field fielddef:autosuggestionPattern / sp:text ?autosuggestionPattern .
-            } OPTIONAL {
-                ?field fielddef:valueSetPattern / sp:text ?valueSetPattern .
-            }
-        }
-    }'''
+    query = f'''SELECT *
+    WHERE {{
+        {FIELD_PATTERN}
+    }}'''
     logging.debug(f"field query='{query}' bindings=('field': {field_uri}, 'graph': {graph_uri}) prefixes={prefixes}")
-    res = store.query(query, initNs=prefixes, initBindings={'field': field_uri, 'graph': graph_uri})
-    if len(res) < 1:
+    res = _query(store, query, initNs=prefixes, initBindings={'field': field_uri, 'graph': graph_uri})
+    field = _read_field_values(res, field_id, _field_properties(prefixes), namespaces)
+    if field is None:
         logging.error(f"Field definition not found for URI={field_uri}")
+        
+    return field
+
+def _field_id(field_uri, field_id_prefix):
+    """return field id of field_uri without field_id_prefix."""
+    field_id = str(field_uri)
+    if field_id_prefix and field_id.startswith(field_id_prefix):
+        field_id = field_id[len(field_id_prefix):]
+        
+    return field_id
+
+def _field_properties(prefixes):
+    """return dict of field attribute and query properties resolved with prefixes."""
+    properties = {_resolve(prefixes, prop): prop for _, prop, _, _ in FIELD_ATTRIBUTES}
+    properties.update({_resolve(prefixes, prop): prop for _, prop in FIELD_QUERIES})
+    return properties
+
+def _read_field_values(rows, field_id, properties, namespaces=None):
+    """create field dict with field_id from the ?property ?value result rows of a field query.
+    namespaces: dict of namespace and prefix for the normalization of URI values (see _namespace_table)
+    returns None if the field has no label.
+    """
+    # collect distinct values per property
+    values = {}
+    for r in rows:
+        if r.value and r.property in properties:
+            values.setdefault(properties[r.property], {})[r.value] = None
+    
+    if 'rdfs:label' not in values:
         return None
     
+    if namespaces is None:
+        namespaces = _namespace_table()
     field = {
         'id': field_id,
     }
-    # loop through possibly multiple attribute values
-    for f in res:
-        _set_once(field, 'label', str(f.label))
-        if f.description:
-            _set_once(field, 'description', str(f.description))
-        if f.domain:
-            _set_append(field, 'domain', _uristr(f.domain))
-        if f.range:
-            _set_append(field, 'range', _uristr(f.range))
-        if f.datatype:
-            _set_once(field, 'datatype', _uristr(f.datatype))
-        if f.minOccurs:
-            _set_once(field, 'minOccurs', str(f.minOccurs))
-        if f.maxOccurs:
-            _set_once(field, 'maxOccurs', str(f.maxOccurs))
-        if f.order:
-            _set_once(field, 'order', str(f.order))
-        if f.defaultValue:
-            _set_append(field, 'defaultValue', str(f.defaultValue))
+    for att, prop, multiple, is_uri in FIELD_ATTRIBUTES:
+        if prop not in values:
+            continue
         
-        queries = {}
-        if f.selectPattern:
-            _set_once(queries, 'select', str(f.selectPattern))
-        if f.insertPattern:
-            _set_once(queries, 'insert', str(f.insertPattern))
-        if f.deletePattern:
-            _set_once(queries, 'delete', str(f.deletePattern))
-        if f.askPattern:
-            _set_once(queries, 'ask', str(f.askPattern))
-        if f.autosuggestionPattern:
-            _set_once(queries, 'autosuggestion', str(f.autosuggestionPattern))
-        if f.valueSetPattern:
-            _set_once(queries, 'valueSet', str(f.valueSetPattern))
-        
-        if queries:
-            field['queries'] = [{k: v} for k, v in queries.items()]
+        # sorted values (the order of rows depends on the store and the read method)
+        vals = sorted(set(_uristr(v, namespaces) if is_uri else str(v) for v in values[prop]))
+        if multiple:
+            field[att] = vals[0] if len(vals) == 1 else vals
+        else:
+            if len(vals) > 1:
+                logging.warning(f"Ignoring different value to set! key={att} value={vals[1:]}")
+            field[att] = vals[0]
+    
+    queries = []
+    for query_type, prop in FIELD_QUERIES:
+        if prop in values:
+            vals = sorted(str(v) for v in values[prop])
+            if len(vals) > 1:
+                logging.warning(f"Ignoring different value to set! key={query_type} value={vals[1:]}")
+            queries.append({query_type: vals[0]})
+    
+    if queries:
+        field['queries'] = queries
     
+    stats.count('fields_read')
     return field
 
 def write_fields_yaml(fields, filename, field_id_prefix=None, splitFields=False):
-    """write all fields to YAML file filename."""
+    """write all fields to YAML file filename.
+    fields can be an iterator, each field is written as soon as it is available.
+    the single file is written to a temporary file that replaces filename when all fields are written
+    (filename is kept if reading the fields fails).
+    the output loads as the same document as yaml.dump of all fields but libyaml folds long scalars
+    differently than the pure Python emitter.
+    returns number of fields written.
+    """
+    cnt = 0
     if splitFields:
         for field in fields:
             fn = quote_plus(field['id']) + '.yml'
@@ -273,12 +626,35 @@ def write_fields_yaml(fields, filename, field_id_prefix=None, splitFields=False)
                 if field_id_prefix:
                     data['prefix'] = field_id_prefix
                 
-                yaml.dump(data, stream=f)
+                with stats.phase('yaml_write'):
+                    yaml.dump(data, stream=f, Dumper=YamlDumper)
+                cnt += 1
+                stats.count('files_written')
+                stats.count('bytes_written', f.tell())
             
     else:
-        with open(filename, 'w') as f:
-            data = {'fields': fields}
-            if field_id_prefix:
-                data['prefix'] = field_id_prefix
+        tmp_file = Path(filename).with_name(f"{Path(filename).name}.{os.getpid()}.tmp")
+        try:
+            with open(tmp_file, 'w') as f:
+                # write the document of yaml.dump({'fields': fields, 'prefix': field_id_prefix}) one field at a time
+                f.write('fields:')
+                for field in fields:
+                    if cnt == 0:
+                        f.write('\n')
+                    with stats.phase('yaml_write'):
+                        yaml.dump([field], stream=f, Dumper=YamlDumper)
+                    cnt += 1
+                    
+                if cnt == 0:
+                    f.write(' []\n')
+                if field_id_prefix:
+                    yaml.dump({'prefix': field_id_prefix}, stream=f, Dumper=YamlDumper)
+                stats.count('files_written')
+                stats.count('bytes_written', f.tell())
+            os.replace(tmp_file, filename)
+            
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
             
-            yaml.dump(data, stream=f)
+    return cnt
@@ -0,0 +1,229 @@
+"""Generate semantic field definitions as RDF quads without templates.
+
+Creates the same quads as the Handlebars templates of the RS, MP and UNI flavors
+(including the HTML-escaping of non-query values) and writes them as N-Quads.
+Backslash escapes in query texts are interpreted like the TriG parser does for the
+long strings of the templates.
+"""
+from SemanticFieldDefinitionGenerator.generator import UNIVERSAL, RESEARCHSPACE, METAPHACTS
+from SemanticFieldDefinitionGenerator import stats
+from rdflib import Dataset, Literal, URIRef
+from rdflib.namespace import Namespace, RDF, RDFS, XSD
+from functools import lru_cache
+import logging
+import re
+
+LDP = Namespace('http://www.w3.org/ns/ldp#')
+PROV = Namespace('http://www.w3.org/ns/prov#')
+SP = Namespace('http://spinrdf.org/sp#')
+CRM = Namespace('http://www.cidoc-crm.org/cidoc-crm/')
+RS_FIELD = Namespace('http://www.researchspace.org/resource/system/fields/')
+RS_USER = Namespace('http://www.researchspace.org/resource/user/')
+RS_CONTAINER = URIRef('http://www.researchspace.org/resource/system/fieldDefinitionContainer')
+MP_FIELD = Namespace('http://www.metaphacts.com/ontology/fields#')
+MP_USER = Namespace('http://www.metaphacts.com/resource/user/')
+MP_CONTAINER = URIRef('http://www.metaphacts.com/ontologies/platform#fieldDefinitionContainer')
+
+# query types in template order with name of query IRI
+QUERY_TYPES = [
+    ('autosuggestion', 'autosuggestion'),
+    ('insert', 'insert'),
+    ('select', 'select'),
+    ('ask', 'ask'),
+    ('delete', 'delete'),
+    ('valueSet', 'values'),
+]
+# field properties in namespace of platform
+FIELD_TERMS = (['Field', 'minOccurs', 'maxOccurs', 'order', 'defaultValue', 'xsdDatatype', 'domain', 'range']
+               + [queryType + 'Pattern' for queryType, _ in QUERY_TYPES])
+
+# platforms: (field terms, container, admin user, prefixes)
+RS_PLATFORM = ({name: RS_FIELD[name] for name in FIELD_TERMS}, RS_CONTAINER, RS_USER['admin'],
+               {'rsfield': RS_FIELD, 'rsuser': RS_USER})
+MP_PLATFORM = ({name: MP_FIELD[name] for name in FIELD_TERMS}, MP_CONTAINER, MP_USER['admin'],
+               {'mpfield': MP_FIELD, 'mpuser': MP_USER})
+PLATFORMS = {
+    RESEARCHSPACE: [RS_PLATFORM],
+    METAPHACTS: [MP_PLATFORM],
+    UNIVERSAL: [RS_PLATFORM, MP_PLATFORM],
+}
+# prefixes of all templates
+PREFIXES = {'crm': CRM, 'ldp': LDP, 'prov': PROV, 'rdfs': RDFS, 'sp': SP, 'xsd': XSD}
+
+CONTAINER_TIME = Literal('2020-04-06T13:49:19.238+03:00', datatype=XSD.dateTime)
+FIELD_TIME = Literal('2021-01-08T11:43:46.111Z', datatype=XSD.dateTime)
+
+_htmlEscapes = str.maketrans({'&': '&amp;', '"': '&quot;', "'": '&#x27;', '`': '&#x60;', '<': '&lt;', '>': '&gt;'})
+_nquadsEscapes = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+# escapes of TriG strings (ECHAR and UCHAR)
+_trigEscapes = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+_trigEscape = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)', re.DOTALL)
+
+
+def _text(value, escape=True):
+    # string value as rendered by the templates
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        value = 'true' if value else 'false'
+    value = str(value)
+    return value.translate(_htmlEscapes) if escape else value
+
+def _trigUnescape(match):
+    escape = match.group(1)
+    if len(escape) > 1:
+        return chr(int(escape[1:], 16))
+    if escape not in _trigEscapes:
+        raise Exception(f"Bad escape \\{escape} in query")
+    return _trigEscapes[escape]
+
+def _trigText(value):
+    # query text as read from the long string of the templates
+    return _trigEscape.sub(_trigUnescape, _text(value, escape=False))
+
+def _list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _resolve(value, prefixes):
+    # URIRef of prefixed name or <IRI>
+    value = str(value).strip()
+    if value.startswith('<') and value.endswith('>'):
+        return URIRef(value[1:-1])
+
+    pref, sep, local = value.partition(':')
+    if sep and pref in prefixes:
+        return URIRef(prefixes[pref] + local)
+
+    raise Exception(f"Unknown namespace prefix in {value}")
+
+def _prefixes(output, add_ns_prefix):
+    prefixes = dict(PREFIXES)
+    for platform in PLATFORMS[output]:
+        prefixes.update(platform[3])
+    if add_ns_prefix:
+        prefixes.update(add_ns_prefix)
+    return prefixes
+
+def _containerQuads(output):
+    quads = []
+    for _, container, admin, _ in PLATFORMS[output]:
+        graph = URIRef(container + '/context')
+        for p, o in [(RDFS.comment, Literal('Container to store field definitions.')),
+                     (RDF.type, LDP.Container), (RDF.type, LDP.Resource), (RDF.type, PROV.Entity),
+                     (RDFS.label, Literal('Form Container')),
+                     (PROV.wasAttributedTo, admin), (PROV.generatedAtTime, CONTAINER_TIME)]:
+            quads.append((container, p, o, graph))
+    return quads
+
+def _fieldQuads(field, prefix, output, prefixes):
+    platforms = PLATFORMS[output]
+    fieldIri = _text(prefix) + _text(field['id'])
+    fieldUri = URIRef(fieldIri)
+    graph = URIRef(fieldIri + '/context')
+    triples = []
+    for _, container, _, _ in platforms:
+        triples.append((container, LDP.contains, fieldUri))
+
+    if field.get('label'):
+        triples.append((fieldUri, RDFS.label, Literal(_text(field['label']))))
+    if field.get('description'):
+        triples.append((fieldUri, RDFS.comment, Literal(_text(field['description']))))
+    for att in ['minOccurs', 'maxOccurs', 'order']:
+        if field.get(att):
+            triples.extend((fieldUri, terms[att], Literal(_text(field[att]))) for terms, _, _, _ in platforms)
+    for value in _list(field.get('defaultValue')):
+        triples.extend((fieldUri, terms['defaultValue'], Literal(_text(value))) for terms, _, _, _ in platforms)
+    if field.get('datatype'):
+        datatype = _resolve(field['datatype'], prefixes)
+        triples.extend((fieldUri, terms['xsdDatatype'], datatype) for terms, _, _, _ in platforms)
+    for att in ['domain', 'range']:
+        for value in _list(field.get(att)):
+            uri = _resolve(value, prefixes)
+            triples.extend((fieldUri, terms[att], uri) for terms, _, _, _ in platforms)
+
+    queryTriples = []
+    for queries in field.get('queries') or []:
+        for queryType, queryName in QUERY_TYPES:
+            if queries.get(queryType):
+                queryUri = URIRef(f"{fieldIri}/query/{queryName}")
+                triples.extend((fieldUri, terms[queryType + 'Pattern'], queryUri) for terms, _, _, _ in platforms)
+                queryTriples.append((queryUri, RDF.type, SP.Query))
+                queryTriples.append((queryUri, SP.text, Literal(_trigText(queries[queryType]))))
+
+    triples.extend((fieldUri, RDF.type, terms['Field']) for terms, _, _, _ in platforms)
+    triples.extend([(fieldUri, RDF.type, LDP.Resource), (fieldUri, RDF.type, PROV.Entity),
+                    (fieldUri, PROV.wasAttributedTo, platforms[0][2]),
+                    (fieldUri, PROV.generatedAtTime, FIELD_TIME)])
+    triples.extend(queryTriples)
+    return [(s, p, o, graph) for s, p, o in triples]
+
+def iter_quads(source, output=UNIVERSAL, add_ns_prefix=None):
+    """generate field definitions in output flavor (RS, MP or UNI) from source.
+    yields lists of quads: the container quads, then the quads of each field.
+    """
+    if output not in PLATFORMS:
+        raise Exception(f"Flavor {output} is not supported by the RDF generator")
+
+    prefixes = _prefixes(output, add_ns_prefix)
+    prefix = source.get('prefix', '')
+    yield _containerQuads(output)
+    for field in source['fields']:
+        try:
+            yield _fieldQuads(field, prefix, output, prefixes)
+        except Exception as e:
+            raise Exception(f"Could not generate definition of field {field.get('id')}: {e}")
+
+@lru_cache(maxsize=4096)
+def _nquadsUri(uri):
+    return f"<{uri}>"
+
+def _nquadsTerm(term):
+    if type(term) is Literal:
+        text = '"' + str(term).translate(_nquadsEscapes) + '"'
+        if term.datatype:
+            text += f"^^{_nquadsUri(term.datatype)}"
+        return text
+    return _nquadsUri(term)
+
+def nquads(quads):
+    """return N-Quads string of quads."""
+    return ''.join(f"{_nquadsTerm(s)} {_nquadsTerm(p)} {_nquadsTerm(o)} {_nquadsTerm(g)} .\n"
+                   for s, p, o, g in quads)
+
+def ntriples(triples):
+    """return N-Triples string of triples (also valid in SPARQL INSERT DATA)."""
+    return ''.join(f"{_nquadsTerm(s)} {_nquadsTerm(p)} {_nquadsTerm(o)} .\n" for s, p, o in triples)
+
+def iter_generate(source, output=UNIVERSAL, add_ns_prefix=None):
+    """generate field definitions in output flavor from source.
+    yields the N-Quads output in chunks: container, one chunk per field.
+    """
+    for quads in iter_quads(source, output, add_ns_prefix=add_ns_prefix):
+        with stats.phase('render'):
+            chunk = nquads(quads)
+        yield chunk
+
+def generate(source, output=UNIVERSAL, splitFields=False, add_ns_prefix=None):
+    """generate field definitions in output flavor from source.
+    returns N-Quads string or list of (field id, N-Quads output) tuples if splitFields.
+    """
+    if not splitFields:
+        return ''.join(iter_generate(source, output, add_ns_prefix=add_ns_prefix))
+
+    prefix = source.get('prefix', '')
+    chunks = iter_generate(source, output, add_ns_prefix=add_ns_prefix)
+    container = next(chunks)
+    return [(prefix + field['id'], container + chunk) for field, chunk in zip(source['fields'], chunks)]
+
+def generate_dataset(source, output=UNIVERSAL, add_ns_prefix=None):
+    """generate field definitions in output flavor from source.
+    returns rdflib Dataset.
+    """
+    store = Dataset()
+    for quads in iter_quads(source, output, add_ns_prefix=add_ns_prefix):
+        logging.debug(f"adding {len(quads)} quads")
+        store.addN(quads)
+
+    return store
@@ -1,27 +1,34 @@
 #!/usr/bin/env python3
-from SemanticFieldDefinitionGenerator import generator, parser
+# modules with heavy dependencies (pybars, rdflib) are imported by the actions that use them
+from SemanticFieldDefinitionGenerator import stats
 from pathlib import Path
-import urllib
+import urllib.parse
 import argparse
+import json
 import logging
 import sys
 
 __version__ = '1.5'
 
+# file with hashes of generated fields in TRIG_FILE directory for option incremental
+MANIFEST_FILE = '.field-manifest.json'
+
 def main():
     ## 
     ## main
     ##
     argp = argparse.ArgumentParser(description='Utility to convert ResarchSpace/Metaphacts semantic field definitions.')
     argp.add_argument('--version', action='version', version='%(prog)s ' + __version__)
-    argp.add_argument('action', choices=['read', 'write'],
+    argp.add_argument('action', choices=['read', 'write', 'sync', 'bench'],
                       help='Action: read=read semantic field definitions in RDF (SPARQL store or file) and write YAML file, '
-                      + 'write=read YAML file and write semantic field definitions to RDF TriG file(s)')
+                      + 'write=read YAML file and write semantic field definitions to RDF TriG file(s), '
+                      + 'sync=read YAML file and update changed semantic field definitions in SPARQL store, '
+                      + 'bench=run benchmarks with synthetic field definitions and print results as JSON')
     argp.add_argument('-f', '--flavor', dest='flavor', choices=['RS', 'MP', 'UNI', 'JSON', 'INLINE'],
                       default='RS',
                       help='Flavor of RDF field definitions: RS=ResearchSpace, MP=Metaphacts, UNI=universal, '
                       + 'JSON=JSON, INLINE=inline, default=RS')
-    argp.add_argument('-y', '--yaml', required=True, dest='yaml_file',
+    argp.add_argument('-y', '--yaml', dest='yaml_file',
                       help='YAML file (can be directory containing *.yml files) with field definitions to read or write')
     argp.add_argument('-u', '--sparql-uri', dest='sparql_uri',
                       help='SPARQL endpoint URI, e.g. http://localhost:8081/sparql')
@@ -31,6 +38,8 @@ def main():
                       help='Optional SPARQL auth username, default=admin')
     argp.add_argument('--sparql-auth-password', dest='sparql_pass', default='admin',
                       help='Optional SPARQL auth password, default=admin')
+    argp.add_argument('--sparql-pool', dest='sparql_pool', action='store_true',
+                      help='Optional use persistent SPARQL connections and retry failed queries')
     argp.add_argument('-t', '--trig', dest='trig_file',
                       help='RDF TriG file (can be directory containing *.trig files) to read or write')
     argp.add_argument('--field-id-prefix', dest='field_prefix',
@@ -39,16 +48,77 @@ def main():
                       help='Optional split TriG/YAML output into one file per field (file name = field id)')
     argp.add_argument('--add-ns-prefix', dest='add_ns_prefix',
                       help='Optional additional namespace prefix e.g. skos=http://www.w3.org/2004/02/skos/core# (multiple separated by comma)')
+    argp.add_argument('--incremental', dest='incremental', action='store_true',
+                      help='Optional only write TriG files of changed fields and remove TriG files of removed fields '
+                      + 'with --split-fields (keeps manifest file in TRIG_FILE directory)')
+    argp.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                      help='Optional number of parallel processes to read YAML/TriG files and render fields with --split-fields '
+                      + 'or number of concurrent SPARQL queries, default=1')
+    argp.add_argument('--yaml-cache', dest='yaml_cache',
+                      help='Optional file to cache parsed YAML files across runs')
+    argp.add_argument('--trig-cache', dest='trig_cache',
+                      help='Optional file to cache parsed TriG files across runs')
+    argp.add_argument('--template-cache', dest='template_cache',
+                      help='Optional directory to cache compiled templates across runs')
+    argp.add_argument('--nquads', dest='nquads', action='store_true',
+                      help='Optional write N-Quads instead of TriG without templates (faster, flavors RS, MP and UNI)')
+    argp.add_argument('--watch', dest='watch', action='store_true',
+                      help='Optional keep running and write changed field definitions when the YAML files change')
+    argp.add_argument('--watch-interval', dest='watch_interval', type=float, default=1.0,
+                      help='Optional seconds between checks of the YAML files with --watch, default=1')
+    argp.add_argument('--bulk-read', dest='bulk_read', action='store_true',
+                      help='Optional read attributes of many fields per SPARQL query (faster for remote stores)')
+    argp.add_argument('--update-file', dest='update_file',
+                      help='Optional write SPARQL updates of action sync to file instead of sending them to the SPARQL store')
+    argp.add_argument('--batch-size', dest='batch_size', type=int, default=100,
+                      help='Optional number of fields per SPARQL update request of action sync, default=100')
+    argp.add_argument('--bench-fields', dest='bench_fields', type=int, default=1000,
+                      help='Optional number of synthetic fields for action bench, default=1000')
+    argp.add_argument('--bench-cardinality', dest='bench_cardinality', type=int, default=1,
+                      help='Optional number of domain, range and defaultValue values of synthetic fields, default=1')
+    argp.add_argument('--bench-query-length', dest='bench_query_length', type=int,
+                      help='Optional minimum length of select queries of synthetic fields')
+    argp.add_argument('--stats', dest='stats', action='store_true',
+                      help='Optional print summary of phase durations, query latencies and written files')
+    argp.add_argument('--stats-json', dest='stats_json',
+                      help='Optional write summary of phase durations, query latencies and written files to JSON file')
+    argp.add_argument('--profile', dest='profile',
+                      help='Optional run with cProfile and write profile data to file (e.g. run.prof)')
     argp.add_argument('-l', '--log', dest='loglevel', choices=['INFO', 'DEBUG', 'ERROR'], default='INFO', 
                       help='Log level.')
     args = argp.parse_args()
     
     logging.basicConfig(level=args.loglevel)
     
+    if args.action != 'bench' and not args.yaml_file:
+        sys.exit(f"ERROR: action '{args.action}' requires YAML_FILE!")
+    
+    if args.profile:
+        # run with profiler and write profile data to file
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(run, args)
+        finally:
+            profiler.dump_stats(args.profile)
+            logging.info(f"wrote profile data to {args.profile}")
+    else:
+        run(args)
+        
+    if args.stats:
+        print(stats.format_summary(), file=sys.stderr)
+        
+    if args.stats_json:
+        with open(args.stats_json, 'w') as f:
+            json.dump(stats.summary(), f, indent=1)
+    
+def run(args):
+    """run action of parsed command line arguments."""
     ##
     ## write action
     ##
     if args.action == 'write':
+        from SemanticFieldDefinitionGenerator import generator
         if args.flavor == 'RS':
             flavor = generator.RESEARCHSPACE
         elif args.flavor == 'MP':
@@ -63,42 +133,123 @@ def main():
         if not args.trig_file:
             sys.exit(f"ERROR: action 'write' requires TRIG_FILE!")
             
+        if args.incremental and not args.split_fields:
+            sys.exit(f"ERROR: option incremental requires option split_fields!")
+            
+        if args.nquads:
+            # generate N-Quads directly
+            from SemanticFieldDefinitionGenerator import rdf_generator
+            if flavor not in rdf_generator.PLATFORMS:
+                sys.exit(f"ERROR: option nquads does not support flavor {args.flavor}!")
+                
+            gen = rdf_generator
+            gen_args = {}
+            suffix = '.nq'
+        else:
+            gen = generator
+            gen_args = {'templateCacheDir': args.template_cache}
+            suffix = '.trig'
+            
         if args.add_ns_prefix:
             add_ns_prefix = { key: val for key, val in [prefs.split('=') for prefs in args.add_ns_prefix.split(',')]}
         else:
             add_ns_prefix = None
     
+        if args.watch:
+            # keep parsed YAML files and outputs in memory and write changed fields
+            from SemanticFieldDefinitionGenerator import watch
+            if args.incremental:
+                sys.exit(f"ERROR: option watch can not be combined with option incremental!")
+                
+            if args.split_fields and not Path(args.trig_file).is_dir():
+                sys.exit(f"ERROR: TRIG_FILE {args.trig_file} must be directory for option split_fields!")
+                    
+            watcher = watch.FieldWatcher(args.yaml_file, args.trig_file, flavor, gen=gen, split_fields=args.split_fields,
+                                         suffix=suffix, add_ns_prefix=add_ns_prefix, gen_args=gen_args,
+                                         workers=args.jobs, cache_file=args.yaml_cache)
+            logging.info(f"writing field definitions from YAML file {args.yaml_file} to {args.trig_file} in flavor {args.flavor}")
+            watcher.build()
+            logging.info(f"watching YAML file {args.yaml_file} for changes (press Ctrl-C to stop)")
+            watch.watch(watcher, interval=args.watch_interval)
+            return
+        
         logging.info(f"reading field definitions from YAML file {args.yaml_file}")
-        model = generator.loadSourceFromFile(args.yaml_file)
+        model = generator.loadSourceFromFile(args.yaml_file, workers=args.jobs, cacheFile=args.yaml_cache)
         logging.info(f"  read {len(model['fields'])} field definitions")
         if args.split_fields:
-            # generate split field list of ids and outputs
-            outputs = generator.generate(model, flavor, splitFields=True, add_ns_prefix=add_ns_prefix)
             p = Path(args.trig_file)
             if not p.is_dir():
                 sys.exit(f"ERROR: TRIG_FILE {p} must be directory for option split_fields!")
                 
+            if args.incremental:
+                # only generate fields that changed since the last run
+                manifest_file = p / MANIFEST_FILE
+                manifest = {}
+                if manifest_file.exists():
+                    with open(manifest_file, 'r') as f:
+                        manifest = json.load(f)
+                        
+                hashes = generator.fieldHashes(model, flavor, add_ns_prefix=add_ns_prefix, renderer=gen)
+                new_manifest = {urllib.parse.quote_plus(field_id) + suffix: h for field_id, h in hashes.items()}
+                prefix = model.get('prefix', '')
+                changed_fields = []
+                for field in model['fields']:
+                    filename = urllib.parse.quote_plus(prefix + field['id']) + suffix
+                    if manifest.get(filename) != new_manifest[filename] or not (p / filename).exists():
+                        changed_fields.append(field)
+                        
+                logging.info(f"  {len(changed_fields)} changed field definitions")
+                model = {'prefix': prefix, 'fields': changed_fields}
+
+            # generate split field list of ids and outputs
+            if not args.nquads:
+                gen_args['workers'] = args.jobs
+            outputs = gen.generate(model, flavor, splitFields=True, add_ns_prefix=add_ns_prefix, **gen_args)
             logging.info(f"writing field definitions to RDF trig files in directory {args.trig_file} in flavor {args.flavor}")
             cnt = 0
             for field_id, output in outputs:
-                filename = urllib.parse.quote_plus(field_id) + '.trig'
+                filename = urllib.parse.quote_plus(field_id) + suffix
                 with open(p / filename, 'w') as f:
                     logging.debug(f"writing trig file {filename}")
-                    f.write(output)
+                    with stats.phase('write'):
+                        f.write(output)
                     cnt += 1
+                    stats.count('files_written')
+                    stats.count('bytes_written', f.tell())
                 
             logging.info(f"  wrote {cnt} trig files")
+            
+            if args.incremental:
+                # remove files of fields that no longer exist
+                cnt = 0
+                for filename in manifest:
+                    if filename not in new_manifest and (p / filename).exists():
+                        logging.debug(f"removing trig file {filename}")
+                        (p / filename).unlink()
+                        cnt += 1
+                        stats.count('files_removed')
+                        
+                logging.info(f"  removed {cnt} trig files")
+                with open(manifest_file, 'w') as f:
+                    json.dump(new_manifest, f, indent=1, sort_keys=True)
 
         else:
-            output = generator.generate(model, flavor, splitFields=False, add_ns_prefix=add_ns_prefix)
+            # generate output in chunks per field
+            outputs = gen.iter_generate(model, flavor, add_ns_prefix=add_ns_prefix, **gen_args)
             with open(args.trig_file, 'w') as f:
                 logging.info(f"writing field definitions to RDF trig file {args.trig_file} in flavor {args.flavor}")
-                f.write(output)
+                for output in outputs:
+                    with stats.phase('write'):
+                        f.write(output)
+                        
+                stats.count('files_written')
+                stats.count('bytes_written', f.tell())
 
     ##
     ## read action
     ##        
     elif args.action == 'read':
+        from SemanticFieldDefinitionGenerator import parser
         if args.flavor == 'RS':
             flavor = parser.RESEARCHSPACE
         elif args.flavor == 'MP':
@@ -114,16 +265,75 @@ def main():
     
         if args.sparql_uri:
             store = parser.open_sparql_store(args.sparql_uri, repository=args.sparql_repository, 
-                                      auth_user=args.sparql_user, auth_pass=args.sparql_pass)
+                                      auth_user=args.sparql_user, auth_pass=args.sparql_pass,
+                                      pooled=args.sparql_pool)
         elif args.trig_file:
-            store = parser.read_trig_store(args.trig_file)
+            store = parser.read_trig_store(args.trig_file, workers=args.jobs, cache_file=args.trig_cache)
         else:
             sys.exit(f"ERROR: action 'read' requires SPARQL_URI or TRIG_FILE!")
     
-        fields = parser.read_fields(store, flavor, field_id_prefix=args.field_prefix, add_ns_prefix=add_ns_prefix)
-        logging.info(f"  found {len(fields)} fields (flavor={args.flavor})")
-        parser.write_fields_yaml(fields, args.yaml_file, field_id_prefix=args.field_prefix, splitFields=args.split_fields)
+        # write fields as they are read
+        fields = parser.iter_fields(store, flavor, field_id_prefix=args.field_prefix, add_ns_prefix=add_ns_prefix,
+                                    bulk=args.bulk_read, workers=args.jobs)
+        cnt = parser.write_fields_yaml(fields, args.yaml_file, field_id_prefix=args.field_prefix, splitFields=args.split_fields)
         if args.split_fields:
-            logging.info(f"  wrote {len(fields)} fields to YAML directory {args.yaml_file}")
+            logging.info(f"  wrote {cnt} fields (flavor={args.flavor}) to YAML directory {args.yaml_file}")
+        else:
+            logging.info(f"  wrote {cnt} fields (flavor={args.flavor}) to YAML file {args.yaml_file}")
+
+    ##
+    ## sync action
+    ##
+    elif args.action == 'sync':
+        from SemanticFieldDefinitionGenerator import generator, parser, sync
+        if args.flavor == 'RS':
+            flavor = parser.RESEARCHSPACE
+        elif args.flavor == 'MP':
+            flavor = parser.METAPHACTS
         else:
-            logging.info(f"  wrote {len(fields)} fields to YAML file {args.yaml_file}")
+            sys.exit(f"ERROR: action 'sync' does not support flavor {args.flavor}!")
+            
+        if not args.sparql_uri:
+            sys.exit(f"ERROR: action 'sync' requires SPARQL_URI!")
+            
+        if args.add_ns_prefix:
+            add_ns_prefix = { key: val for key, val in [prefs.split('=') for prefs in args.add_ns_prefix.split(',')]}
+        else:
+            add_ns_prefix = None
+    
+        logging.info(f"reading field definitions from YAML file {args.yaml_file}")
+        model = generator.loadSourceFromFile(args.yaml_file, workers=args.jobs, cacheFile=args.yaml_cache)
+        logging.info(f"  read {len(model['fields'])} field definitions")
+        store = parser.open_sparql_store(args.sparql_uri, repository=args.sparql_repository, 
+                                         auth_user=args.sparql_user, auth_pass=args.sparql_pass,
+                                         pooled=args.sparql_pool)
+        update_store = None
+        if not args.update_file:
+            update_store = parser.open_sparql_store(args.sparql_uri, repository=args.sparql_repository, 
+                                                    auth_user=args.sparql_user, auth_pass=args.sparql_pass,
+                                                    update=True)
+            
+        logging.info(f"comparing field definitions (flavor={args.flavor}) with SPARQL store")
+        diff, requests = sync.sync_fields(store, model, flavor, update_store=update_store, add_ns_prefix=add_ns_prefix,
+                                          field_id_prefix=args.field_prefix, batch_size=args.batch_size,
+                                          dry_run=bool(args.update_file),
+                                          bulk=args.bulk_read, workers=args.jobs)
+        if args.update_file:
+            with open(args.update_file, 'w') as f:
+                for request in requests:
+                    f.write(request + '\n\n')
+                    
+            logging.info(f"  wrote {len(requests)} SPARQL update requests to file {args.update_file}")
+        else:
+            logging.info(f"  sent {len(requests)} SPARQL update requests")
+
+    ##
+    ## bench action
+    ##
+    elif args.action == 'bench':
+        from SemanticFieldDefinitionGenerator import benchmark
+        logging.info(f"running benchmarks with {args.bench_fields} synthetic fields")
+        results = benchmark.run_suite(args.bench_fields, cardinality=args.bench_cardinality,
+                                      query_length=args.bench_query_length)
+        json.dump(results, sys.stdout, indent=1)
+        print()
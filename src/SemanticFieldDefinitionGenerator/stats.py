@@ -0,0 +1,88 @@
+"""Lightweight timing and counter statistics of the generator and parser.
+
+Records phase durations, counters and latency histograms of the current process
+(work done in worker processes is not included).
+"""
+from contextlib import contextmanager
+import threading
+import time
+
+# upper bounds of latency histogram buckets in seconds
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+_lock = threading.Lock()
+# phase name -> [count, seconds]
+_phases = {}
+# counter name -> value
+_counters = {}
+# histogram name -> list of counts per bucket (last bucket for larger values)
+_histograms = {}
+
+
+def add_time(name, seconds):
+    """add duration in seconds to phase name."""
+    with _lock:
+        phase = _phases.setdefault(name, [0, 0.0])
+        phase[0] += 1
+        phase[1] += seconds
+
+@contextmanager
+def phase(name):
+    """context manager that adds its duration to phase name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+def count(name, value=1):
+    """add value to counter name."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def observe(name, seconds):
+    """add latency in seconds to histogram name."""
+    bucket = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            bucket = i
+            break
+
+    with _lock:
+        histogram = _histograms.setdefault(name, [0] * (len(LATENCY_BUCKETS) + 1))
+        histogram[bucket] += 1
+
+def reset():
+    """remove all recorded statistics."""
+    with _lock:
+        _phases.clear()
+        _counters.clear()
+        _histograms.clear()
+
+def summary():
+    """return dict of recorded phases, counters and histograms (JSON serializable)."""
+    labels = [f"<={bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+    with _lock:
+        return {
+            'phases': {name: {'count': n, 'seconds': seconds} for name, (n, seconds) in _phases.items()},
+            'counters': dict(_counters),
+            'histograms': {name: dict(zip(labels, counts)) for name, counts in _histograms.items()},
+        }
+
+def format_summary(data=None):
+    """return summary as text."""
+    if data is None:
+        data = summary()
+
+    lines = ['phases:']
+    for name, phase in sorted(data['phases'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append(f"  {name}: {phase['seconds']:.3f}s ({phase['count']}x)")
+    lines.append('counters:')
+    for name, value in sorted(data['counters'].items()):
+        lines.append(f"  {name}: {value}")
+    for name, histogram in sorted(data['histograms'].items()):
+        lines.append(f"{name}:")
+        for label, n in histogram.items():
+            if n:
+                lines.append(f"  {label}: {n}")
+    return '\n'.join(lines)
@@ -0,0 +1,144 @@
+"""Synchronize semantic field definitions in a SPARQL store with a field definition model.
+
+Fields of the model are compared with the fields in the store as read by the parser
+and only the named graphs of added, changed and removed fields are updated.
+"""
+from SemanticFieldDefinitionGenerator import parser, rdf_generator, stats
+from collections import Counter, namedtuple
+import logging
+import time
+
+# lists of field IRIs
+FieldDiff = namedtuple('FieldDiff', ['added', 'changed', 'removed'])
+
+
+def _normalize(field):
+    """return comparable form of field dict as read by the parser."""
+    norm = {}
+    for att, value in field.items():
+        if att == 'queries':
+            value = sorted((query_type, query) for queries in value for query_type, query in queries.items())
+        elif isinstance(value, list):
+            value = sorted(str(v) for v in value)
+        else:
+            value = str(value)
+        norm[att] = value
+
+    return norm
+
+def model_fields(model, flavor, add_ns_prefix=None):
+    """return dict of field IRI and field dict for the fields of model
+    as they are read back from the generated RDF
+    (the quads of rdf_generator equal the quads of the TriG written by the templates).
+    """
+    store = rdf_generator.generate_dataset(model, flavor, add_ns_prefix=add_ns_prefix)
+    fields = {field['id']: field for field in parser.iter_fields(store, flavor, add_ns_prefix=add_ns_prefix)}
+    if len(fields) < len(model['fields']):
+        logging.warning(f"Ignoring {len(model['fields']) - len(fields)} fields without label")
+
+    return fields
+
+def diff_fields(current, expected, field_id_prefix=None):
+    """compare dicts of field IRI and field dict of current and expected fields.
+    only current fields with IRIs starting with field_id_prefix are removed
+    (no fields are removed without field_id_prefix).
+    returns FieldDiff.
+    """
+    added = [iri for iri in expected if iri not in current]
+    changed = [iri for iri in expected if iri in current and _normalize(current[iri]) != _normalize(expected[iri])]
+    removed = []
+    if field_id_prefix:
+        removed = [iri for iri in current if iri not in expected and iri.startswith(field_id_prefix)]
+    return FieldDiff(added, changed, removed)
+
+def _remove_field(iri, graph, shared):
+    # update operation that removes field iri from graph
+    if not shared:
+        return f"DROP SILENT GRAPH <{graph}>"
+    
+    # graph contains other fields: remove container link, field and its queries
+    return (f"DELETE {{ GRAPH <{graph}> {{ ?container <{rdf_generator.LDP.contains}> <{iri}> . <{iri}> ?p ?o . ?o ?qp ?qo }} }}\n"
+            f"WHERE {{ GRAPH <{graph}> {{ {{ ?container <{rdf_generator.LDP.contains}> <{iri}> }} UNION "
+            f"{{ <{iri}> ?p ?o OPTIONAL {{ ?o a <{rdf_generator.SP.Query}> ; ?qp ?qo }} }} }} }}")
+
+def _field_updates(model, flavor, iris, removals, add_ns_prefix):
+    # yield update operations that replace the fields with IRIs in iris
+    prefix = model.get('prefix', '')
+    fields = [field for field in model['fields'] if prefix + field['id'] in iris]
+    quads = rdf_generator.iter_quads({'prefix': prefix, 'fields': fields}, flavor, add_ns_prefix=add_ns_prefix)
+    # skip container quads
+    next(quads)
+    for field_quads in quads:
+        # first quad: container ldp:contains field
+        _, _, iri, graph = field_quads[0]
+        triples = rdf_generator.ntriples((s, p, o) for s, p, o, _ in field_quads)
+        # removal operations of the current graphs of field
+        operations = removals(str(iri))
+        operations.append(f"INSERT DATA {{ GRAPH <{graph}> {{\n{triples}}} }}")
+        yield ' ;\n'.join(operations)
+
+def update_requests(model, flavor, diff, add_ns_prefix=None, batch_size=100, graphs=None):
+    """yield SPARQL Update requests for diff with the operations of up to batch_size fields each.
+    added and changed fields are removed from their graphs and inserted in their new graph,
+    removed fields are removed from their graphs.
+    graphs: dict of field IRI and list of IRIs of the graphs of the field in the store
+    (see parser.field_graphs, default: the graph <IRI>/context of each field)
+    graphs containing only one field are dropped.
+    """
+    if graphs is None:
+        graphs = {iri: [f"{iri}/context"] for iri in diff.added + diff.changed + diff.removed}
+    # number of fields per graph
+    counts = Counter(graph for iri_graphs in graphs.values() for graph in iri_graphs)
+    
+    def _removals(iri):
+        return [_remove_field(iri, graph, counts[graph] > 1) for graph in graphs.get(iri, [])]
+    
+    operations = _field_updates(model, flavor, set(diff.added + diff.changed), _removals, add_ns_prefix)
+    removals = (' ;\n'.join(_removals(iri)) for iri in diff.removed if graphs.get(iri))
+    batch = []
+    for operation in [*operations, *removals]:
+        batch.append(operation)
+        if len(batch) == batch_size:
+            yield ' ;\n'.join(batch)
+            batch = []
+
+    if batch:
+        yield ' ;\n'.join(batch)
+
+def sync_fields(store, model, flavor, update_store=None, add_ns_prefix=None, field_id_prefix=None, batch_size=100,
+                dry_run=False, **kwargs):
+    """update fields of flavor in store to match the fields of model.
+    update_store: store to send updates to (default store)
+    field_id_prefix: only remove fields with IRIs starting with field_id_prefix (default prefix of model)
+    dry_run: only return the update requests
+    kwargs: arguments for parser.iter_fields
+    returns tuple of FieldDiff and list of SPARQL Update requests.
+    """
+    current = {field['id']: field for field in parser.iter_fields(store, flavor, add_ns_prefix=add_ns_prefix, **kwargs)}
+    graphs = {}
+    for graph, iri in parser.field_graphs(store, flavor, add_ns_prefix=add_ns_prefix, native=kwargs.get('native')):
+        graphs.setdefault(str(iri), []).append(str(graph))
+        
+    expected = model_fields(model, flavor, add_ns_prefix=add_ns_prefix)
+    if field_id_prefix is None:
+        field_id_prefix = model.get('prefix')
+    if not field_id_prefix:
+        logging.warning("Not removing fields without prefix in the model or field id prefix")
+        
+    diff = diff_fields(current, expected, field_id_prefix)
+    logging.info(f"  {len(diff.added)} added, {len(diff.changed)} changed and {len(diff.removed)} removed fields")
+    requests = list(update_requests(model, flavor, diff, add_ns_prefix=add_ns_prefix, batch_size=batch_size,
+                                    graphs=graphs))
+    if not dry_run:
+        if update_store is None:
+            update_store = store
+
+        for request in requests:
+            logging.debug(f"update request='{request}'")
+            start = time.perf_counter()
+            update_store.update(request)
+            elapsed = time.perf_counter() - start
+            stats.add_time('update', elapsed)
+            stats.observe('update_latency', elapsed)
+
+    return diff, requests
@@ -0,0 +1,202 @@
+"""Watch YAML field definitions and write the generated field definitions when they change.
+
+Keeps the parsed YAML files, the compiled templates and the generated output of each field
+in memory. Polls the modification times of the YAML files, parses only changed files and
+generates only the fields whose content changed.
+"""
+from SemanticFieldDefinitionGenerator import generator, stats
+from pathlib import Path
+import urllib.parse
+import logging
+import time
+
+
+class FieldWatcher:
+    """generator of field definitions from YAML file or directory of *.yml files yaml_file
+    to output_file (directory with one file per field if split_fields).
+    gen: generator module (generator or rdf_generator)
+    suffix: suffix of split field files
+    gen_args: additional arguments for gen.generate and gen.iter_generate
+    workers: number of processes to parse YAML files and render split fields in the first build
+    (later builds render with the compiled template of this process)
+    cache_file: YAML cache file for the first build
+    """
+    def __init__(self, yaml_file, output_file, flavor, gen=generator, split_fields=False, suffix='.trig',
+                 add_ns_prefix=None, gen_args=None, workers=None, cache_file=None):
+        self.yaml_file = Path(yaml_file)
+        self.output_file = Path(output_file)
+        self.flavor = flavor
+        self.gen = gen
+        self.split_fields = split_fields
+        self.suffix = suffix
+        self.add_ns_prefix = add_ns_prefix
+        self.gen_args = gen_args or {}
+        self.workers = workers
+        self.cache_file = cache_file
+        # separator of fields in unsplit output
+        self.separator = generator.JSON_FRAMES[flavor][1] if flavor in generator.JSON_OUTPUTS else ''
+        # YAML file path -> (mtime, size), parsed source, dict of field id and hash
+        self.keys = {}
+        self.sources = {}
+        self.hashes = {}
+        self.prefix = None
+        # field id (with prefix) -> hash of generated field
+        self.fields = {}
+        # unsplit output: header, field id -> output, footer
+        self.header = ''
+        self.chunks = {}
+        self.footer = ''
+
+    def _files(self):
+        if self.yaml_file.is_dir():
+            return list(self.yaml_file.glob('*.yml'))
+        return [self.yaml_file]
+
+    def _load(self, files, keys):
+        # parse changed files and return merged source
+        # (files with errors keep their last parsed source)
+        changed = [fn for fn in files if self.keys.get(str(fn)) != keys[str(fn)]]
+        if self.keys:
+            stats.count('yaml_files_parsed', len(changed))
+            for fn in changed:
+                try:
+                    source = generator._loadYamlFile(fn)
+                except Exception as e:
+                    logging.error(e)
+                    continue
+                
+                logging.debug(f"parsed yaml file {fn}")
+                self.sources[str(fn)] = source
+                self.hashes.pop(str(fn), None)
+        else:
+            # first build uses workers and cache file
+            sources = generator._loadYamlFiles(changed, workers=self.workers, cacheFile=self.cache_file)
+            self.sources.update((str(fn), source) for fn, source in zip(changed, sources))
+        self.keys = keys
+
+        for fn in set(self.sources) - set(keys):
+            logging.debug(f"removed yaml file {fn}")
+            del self.sources[fn]
+            self.hashes.pop(fn, None)
+
+        files = [fn for fn in files if str(fn) in self.sources]
+        if self.yaml_file.is_dir():
+            return files, generator._mergeSources(files, [self.sources[str(fn)] for fn in files])
+        return files, self.sources[str(files[0])]
+
+    def _render(self, model, fields, workers=None):
+        # return list of (field id, output) tuples of fields of model
+        source = {'prefix': model.get('prefix', ''), 'fields': fields}
+        if self.split_fields:
+            gen_args = dict(self.gen_args)
+            if workers and self.gen is generator:
+                gen_args['workers'] = workers
+            return list(self.gen.generate(source, self.flavor, splitFields=True, add_ns_prefix=self.add_ns_prefix,
+                                          **gen_args))
+
+        # chunks: header, one chunk per field (with separator after the first), footer
+        chunks = list(self.gen.iter_generate(source, self.flavor, add_ns_prefix=self.add_ns_prefix, **self.gen_args))
+        self.header = chunks[0]
+        self.footer = ''.join(chunks[1 + len(fields):])
+        outputs = []
+        for index, (field, chunk) in enumerate(zip(fields, chunks[1:])):
+            if index > 0:
+                chunk = chunk[len(self.separator):]
+            outputs.append((source['prefix'] + field['id'], chunk))
+        return outputs
+
+    def _write(self, outputs, removed):
+        if self.split_fields:
+            for field_id, output in outputs:
+                filename = self.output_file / (urllib.parse.quote_plus(field_id) + self.suffix)
+                logging.debug(f"writing file {filename}")
+                with open(filename, 'w') as f:
+                    with stats.phase('write'):
+                        f.write(output)
+                    stats.count('files_written')
+                    stats.count('bytes_written', f.tell())
+
+            for field_id in removed:
+                filename = self.output_file / (urllib.parse.quote_plus(field_id) + self.suffix)
+                if filename.exists():
+                    logging.debug(f"removing file {filename}")
+                    filename.unlink()
+                    stats.count('files_removed')
+
+        else:
+            self.chunks.update(outputs)
+            for field_id in removed:
+                del self.chunks[field_id]
+
+            with open(self.output_file, 'w') as f:
+                with stats.phase('write'):
+                    f.write(self.header)
+                    f.write(self.separator.join(self.chunks[field_id] for field_id in self.fields))
+                    f.write(self.footer)
+                stats.count('files_written')
+                stats.count('bytes_written', f.tell())
+
+    def build(self):
+        """parse changed YAML files and write the changed fields.
+        returns tuple of numbers of written and removed fields or None if no YAML file changed.
+        """
+        start = time.perf_counter()
+        files = self._files()
+        keys = {}
+        for fn in files:
+            stat = fn.stat()
+            keys[str(fn)] = (stat.st_mtime_ns, stat.st_size)
+        if keys == self.keys:
+            return None
+
+        first = not self.keys
+        if first and self.gen is generator:
+            # compile templates in this process for the following builds
+            generator.precompile([self.flavor], self.gen_args.get('templateCacheDir'))
+        files, model = self._load(files, keys)
+        prefix = model.get('prefix', '')
+        if prefix != self.prefix:
+            # field ids and outputs of all files change
+            self.hashes.clear()
+            self.prefix = prefix
+
+        fields = {}
+        hashes = {}
+        for fn in files:
+            source = self.sources[str(fn)]
+            if str(fn) not in self.hashes:
+                self.hashes[str(fn)] = generator.fieldHashes({'prefix': prefix, 'fields': source['fields']},
+                                                             self.flavor, add_ns_prefix=self.add_ns_prefix,
+                                                             renderer=self.gen)
+            hashes.update(self.hashes[str(fn)])
+        for field in model['fields']:
+            fields[prefix + field['id']] = field
+
+        changed = [field for field_id, field in fields.items() if self.fields.get(field_id) != hashes[field_id]]
+        removed = [field_id for field_id in self.fields if field_id not in fields]
+        outputs = self._render(model, changed, workers=self.workers if first else None)
+        # keep order of fields in model
+        self.fields = {field_id: hashes[field_id] for field_id in fields}
+        self._write(outputs, removed)
+        stats.count('watch_builds')
+        logging.info(f"  wrote {len(changed)} changed and removed {len(removed)} field definitions "
+                     f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return len(changed), len(removed)
+
+def watch(watcher, interval=1.0, max_builds=None):
+    """poll the YAML files of watcher every interval seconds and build changed fields
+    (until interrupted or after max_builds builds).
+    errors in YAML files are logged and the files are parsed again when they change.
+    """
+    builds = 0
+    try:
+        while max_builds is None or builds < max_builds:
+            time.sleep(interval)
+            try:
+                if watcher.build() is not None:
+                    builds += 1
+            except Exception as e:
+                logging.error(f"Could not generate field definitions: {e}")
+
+    except KeyboardInterrupt:
+        logging.info("stopped watching")
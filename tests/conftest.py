@@ -0,0 +1,99 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import random
+import threading
+import time
+import pytest
+
+
+class StubSPARQLHandler(BaseHTTPRequestHandler):
+    """SPARQL protocol handler answering queries and applying updates with the server's store."""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._query(parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        if self.headers.get('Content-Type', '').startswith('application/sparql-update'):
+            self._update(body)
+        else:
+            with self.server.lock:
+                self.server.posted_queries += 1
+            self._query(parse_qs(body))
+
+    def _update(self, update):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.updates += 1
+            server.store.update(update)
+            server.responses.clear()
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _query(self, params):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.fail_every and server.requests % server.fail_every == 0
+
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+        if fail:
+            self.send_error(503)
+            return
+
+        query = params['query'][0]
+        with server.lock:
+            data = server.responses.get(query)
+            if data is None:
+                data = server.store.query(query).serialize(format='xml')
+                server.responses[query] = data
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/sparql-results+xml')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubSPARQLServer(ThreadingHTTPServer):
+    """local SPARQL endpoint for store with injected latency (plus random jitter, in seconds)
+    that fails every fail_every-th request with 503.
+    """
+    daemon_threads = True
+
+    def __init__(self, store, latency=0, jitter=0, fail_every=None):
+        super().__init__(('127.0.0.1', 0), StubSPARQLHandler)
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_every = fail_every
+        self.requests = 0
+        self.updates = 0
+        self.posted_queries = 0
+        self.responses = {}
+        self.lock = threading.Lock()
+        self.endpoint = f'http://127.0.0.1:{self.server_port}/sparql'
+
+
+@pytest.fixture
+def sparql_server():
+    """return function that starts a StubSPARQLServer for a store (stopped after the test)."""
+    servers = []
+
+    def _start(store, **kwargs):
+        server = StubSPARQLServer(store, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,167 @@
+from SemanticFieldDefinitionGenerator import generator, rdf_generator, stats
+import json
+import os
+import pickle
+import re
+import pytest
+
+MODEL = {'prefix': 'http://example.org/fields/', 'fields': [{'id': 'a', 'label': 'A'}, {'id': 'b', 'label': 'B'}]}
+
+
+def test_field_hashes():
+    hashes = generator.fieldHashes(MODEL, generator.RESEARCHSPACE)
+    assert list(hashes) == ['http://example.org/fields/a', 'http://example.org/fields/b']
+    assert hashes == generator.fieldHashes(MODEL, generator.RESEARCHSPACE, renderer=generator)
+    changed = {'prefix': MODEL['prefix'], 'fields': [{'id': 'a', 'label': 'Changed'}, MODEL['fields'][1]]}
+    changed_hashes = generator.fieldHashes(changed, generator.RESEARCHSPACE)
+    assert [hashes[key] == changed_hashes[key] for key in hashes] == [False, True]
+
+def test_field_hashes_depend_on_renderer():
+    templates = generator.fieldHashes(MODEL, generator.RESEARCHSPACE)
+    nquads = generator.fieldHashes(MODEL, generator.RESEARCHSPACE, renderer=rdf_generator)
+    json = generator.fieldHashes(MODEL, generator.JSON)
+    inline = generator.fieldHashes(MODEL, generator.INLINE)
+    hashes = [templates, nquads, json, inline]
+    for i, a in enumerate(hashes):
+        for b in hashes[i + 1:]:
+            assert set(a.values()).isdisjoint(b.values())
+
+def test_iter_generate_close_early():
+    chunks = generator.iter_generate(MODEL, generator.RESEARCHSPACE)
+    next(chunks)
+    next(chunks)
+    chunks.close()
+
+def test_iter_generate_equals_generate():
+    for output in [generator.RESEARCHSPACE, generator.UNIVERSAL, generator.JSON, generator.INLINE]:
+        assert ''.join(generator.iter_generate(MODEL, output)) == generator.generate(MODEL, output)
+
+def test_render_error_cause():
+    try:
+        generator._renderPart(lambda context: context['missing'], {})
+    except Exception as e:
+        assert isinstance(e.__cause__, KeyError)
+    else:
+        assert False, 'no exception'
+
+PARALLEL_MODEL = {'prefix': MODEL['prefix'], 'fields': [{'id': f'f{i}', 'label': f'F {i}'} for i in range(20)]}
+
+def test_generate_parallel():
+    outputs = generator.generate(PARALLEL_MODEL, generator.RESEARCHSPACE, splitFields=True, workers=2)
+    assert list(outputs) == generator.generate(PARALLEL_MODEL, generator.RESEARCHSPACE, splitFields=True)
+
+def test_generate_parallel_close_early():
+    outputs = generator.generate(PARALLEL_MODEL, generator.RESEARCHSPACE, splitFields=True, workers=2)
+    assert next(outputs) == generator.generate(PARALLEL_MODEL, generator.RESEARCHSPACE, splitFields=True)[0]
+    # closing early cancels the remaining fields
+    outputs.close()
+
+def test_generate_parallel_error_cause():
+    model = {'prefix': MODEL['prefix'], 'fields': [{'label': 'no id'}]}
+    try:
+        list(generator.generate(model, generator.RESEARCHSPACE, splitFields=True, workers=2))
+    except Exception as e:
+        assert isinstance(e.__cause__, KeyError)
+    else:
+        assert False, 'no exception'
+
+def test_generate_parallel_empty_template_cache(tmp_path, monkeypatch):
+    # workers compile the same template into the empty cache directory
+    monkeypatch.setattr(generator, '_templates', {})
+    outputs = generator.generate(PARALLEL_MODEL, generator.RESEARCHSPACE, splitFields=True, workers=2,
+                                 templateCacheDir=tmp_path)
+    assert list(outputs) == generator.generate(PARALLEL_MODEL, generator.RESEARCHSPACE, splitFields=True)
+    assert list(tmp_path.glob('*.tmp')) == []
+    assert len(list(tmp_path.glob('*.py'))) == 1
+
+JSON_FIELD = {
+    'id': 'quoted',
+    'label': 'Label & <"quoted">',
+    'minOccurs': 0,
+    'maxOccurs': 'unbounded',
+    'domain': 'crm:E22_Human-Made_Object',
+    'datatype': 'xsd:anyURI',
+    'treePatterns': {'type': '', 'rootsQuery': 'SELECT ?item WHERE { ?item rdfs:label "root\\n" }'},
+    'queries': [{'select': 'SELECT ?value WHERE { $subject rdfs:label ?value FILTER(?value != "a\\"b") }'}],
+}
+JSON_EXPECTED = {
+    'id': 'quoted',
+    'label': 'Label & <"quoted">',
+    'minOccurs': '0',
+    'maxOccurs': 'unbounded',
+    'xsdDatatype': 'xsd:anyURI',
+    'domain': ['crm:E22_Human-Made_Object'],
+    'treePatterns': {'rootsQuery': 'SELECT ?item WHERE { ?item rdfs:label "root\\n" }'},
+    'selectPattern': 'SELECT ?value WHERE { $subject rdfs:label ?value FILTER(?value != "a\\"b") }',
+    'iri': 'http://example.org/fields/quoted',
+}
+
+@pytest.mark.parametrize('use_orjson', [True, False], ids=['orjson', 'json'])
+def test_generate_json(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(generator, 'orjson', None)
+    model = {'prefix': MODEL['prefix'], 'fields': [JSON_FIELD] + MODEL['fields']}
+    fields = json.loads(generator.generate(model, generator.JSON))
+    assert fields[0] == JSON_EXPECTED
+    assert [field['id'] for field in fields] == ['quoted', 'a', 'b']
+
+    split = generator.generate(model, generator.JSON, splitFields=True)
+    assert [field_id for field_id, _ in split] == [field['iri'] for field in fields]
+    assert [json.loads(output) for _, output in split] == [[field] for field in fields]
+
+def test_generate_inline():
+    model = {'prefix': MODEL['prefix'], 'fields': [JSON_FIELD] + MODEL['fields']}
+    output = generator.generate(model, generator.INLINE)
+    partials = re.findall(r'\[\[#\*inline "([^"]*)"\]\]\n(.*)\n\[\[/inline\]\]\n', output)
+    assert ''.join(f'[[#*inline "{field_id}"]]\n{field_json}\n[[/inline]]\n'
+                   for field_id, field_json in partials) == output
+    assert [field_id for field_id, _ in partials] == ['quoted', 'a', 'b']
+    assert json.loads(partials[0][1]) == JSON_EXPECTED
+    split = generator.generate(model, generator.INLINE, splitFields=True)
+    assert ''.join(output for _, output in split) == output
+
+def _counters():
+    counters = stats.summary()['counters']
+    stats.reset()
+    return counters.get('yaml_files_parsed', 0), counters.get('yaml_files_cached', 0)
+
+def test_yaml_cache(tmp_path):
+    yaml_dir = tmp_path / 'yaml'
+    yaml_dir.mkdir()
+    for name in 'abc':
+        (yaml_dir / f'{name}.yml').write_text(f'prefix: {MODEL["prefix"]}\nfields:\n    - id: {name}\n      label: {name}\n')
+    cache_file = tmp_path / 'cache.pickle'
+    stats.reset()
+    source = generator.loadSourceFromFile(yaml_dir, cacheFile=cache_file)
+    assert _counters() == (3, 0)
+    assert generator.loadSourceFromFile(yaml_dir, cacheFile=cache_file) == source
+    assert _counters() == (0, 3)
+
+    # changed mtime
+    a = yaml_dir / 'a.yml'
+    stat = a.stat()
+    os.utime(a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert generator.loadSourceFromFile(yaml_dir, cacheFile=cache_file) == source
+    assert _counters() == (1, 2)
+    # changed size with same mtime
+    stat = a.stat()
+    a.write_text(a.read_text().replace('label: a', 'label: changed'))
+    os.utime(a, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    labels = {field['id']: field['label'] for field in generator.loadSourceFromFile(yaml_dir, cacheFile=cache_file)['fields']}
+    assert labels == {'a': 'changed', 'b': 'b', 'c': 'c'}
+    assert _counters() == (1, 2)
+
+    # deleted file is pruned from the cache
+    (yaml_dir / 'b.yml').unlink()
+    fields = generator.loadSourceFromFile(yaml_dir, cacheFile=cache_file)['fields']
+    assert sorted(field['id'] for field in fields) == ['a', 'c']
+    assert _counters() == (0, 2)
+    with open(cache_file, 'rb') as f:
+        assert set(pickle.load(f)) == {str(yaml_dir / 'a.yml'), str(yaml_dir / 'c.yml')}
+
+    # workers parse like a single process
+    stats.reset()
+    parallel = generator.loadSourceFromFile(yaml_dir, workers=2, cacheFile=tmp_path / 'parallel.pickle')
+    assert parallel == generator.loadSourceFromFile(yaml_dir)
+    # two files parsed by the workers and again without cache
+    assert _counters() == (4, 0)
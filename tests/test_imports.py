@@ -0,0 +1,59 @@
+import subprocess
+import sys
+import pytest
+
+YAML = '''prefix: http://example.org/fields/
+fields:
+    - id: name
+      label: Name
+      datatype: xsd:string
+      domain: crm:E22_Human-Made_Object
+'''
+CLI = 'from SemanticFieldDefinitionGenerator.semantic_field_util import main; main()'
+
+
+def _imports(args, cwd):
+    """run command line tool with python -X importtime.
+    returns dict of imported top level packages and total import time in seconds.
+    """
+    code = CLI if args is not None else 'import SemanticFieldDefinitionGenerator.semantic_field_util'
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', code] + (args or []), cwd=cwd,
+                         capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    packages = {}
+    # lines: import time: self [us] | cumulative | imported package
+    for line in res.stderr.splitlines():
+        if line.startswith('import time:') and 'self' not in line:
+            self_time, _, name = line.split(':', 1)[1].split('|')
+            package = name.strip().split('.')[0]
+            packages[package] = packages.get(package, 0) + int(self_time) / 1e6
+    return packages, sum(packages.values())
+
+@pytest.fixture(scope='module')
+def workdir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('imports')
+    (path / 'fields.yml').write_text(YAML)
+    trig = subprocess.run([sys.executable, '-c', CLI, 'write', '-f', 'RS', '-y', 'fields.yml', '-t', 'fields.trig'],
+                          cwd=path, capture_output=True, text=True)
+    assert trig.returncode == 0, trig.stderr
+    return path
+
+# action: (command line arguments, packages not imported, import time budget in seconds)
+ACTIONS = {
+    'cli_module': (None, ['pybars', 'rdflib', 'yaml'], 0.5),
+    'help': (['-h'], ['pybars', 'rdflib', 'yaml'], 0.5),
+    'write_json': (['write', '-f', 'JSON', '-y', 'fields.yml', '-t', 'fields.json'], ['pybars', 'rdflib'], 1.0),
+    'write_inline': (['write', '-f', 'INLINE', '-y', 'fields.yml', '-t', 'fields.html'], ['pybars', 'rdflib'], 1.0),
+    'write_rs': (['write', '-f', 'RS', '-y', 'fields.yml', '-t', 'out.trig'], ['rdflib'], None),
+    'write_nquads': (['write', '-f', 'RS', '--nquads', '-y', 'fields.yml', '-t', 'out.nq'], ['pybars'], None),
+    'read': (['read', '-f', 'RS', '-y', 'read.yml', '-t', 'fields.trig'], ['pybars'], None),
+}
+
+@pytest.mark.parametrize('action', ACTIONS.values(), ids=ACTIONS.keys())
+def test_lazy_imports(workdir, action):
+    args, absent, budget = action
+    packages, total = _imports(args, workdir)
+    for package in absent:
+        assert package not in packages
+    if budget is not None:
+        assert total < budget
@@ -0,0 +1,129 @@
+from SemanticFieldDefinitionGenerator import generator, parser, stats
+from rdflib import Dataset
+import os
+import pickle
+import pytest
+import yaml
+
+PREFIX = 'http://example.org/fields/'
+ADD_NS_PREFIX = {'skos': 'http://www.w3.org/2004/02/skos/core#'}
+MODEL = {
+    'prefix': PREFIX,
+    'fields': [{
+        'id': f'field{i}',
+        'label': f'Field {i}',
+        'description': f'Description of field {i}',
+        'datatype': 'xsd:string',
+        'domain': ['crm:E22_Human-Made_Object', 'skos:Concept', '<http://other.org/x#Y>'],
+        'range': 'crm:E41_Appellation',
+        'minOccurs': 0,
+        'maxOccurs': i + 1,
+        'order': i,
+        'defaultValue': ['b', 'a', 'c'],
+        'queries': [
+            {'select': f'SELECT ?value WHERE {{ $subject crm:P1_is_identified_by ?value }} # {i}'},
+            {'insert': 'INSERT { $subject crm:P1_is_identified_by $value } WHERE {}'},
+            {'delete': 'DELETE { $subject crm:P1_is_identified_by $value } WHERE {}'},
+            {'ask': 'ASK { ?value a crm:E41_Appellation }'},
+        ],
+    } for i in range(7)],
+}
+# read options of the native, per field, bulk and concurrent read paths
+READ_OPTIONS = {
+    'per_field': {'native': False},
+    'bulk': {'native': False, 'bulk': True, 'chunk_size': 3},
+    'concurrent': {'native': False, 'workers': 3},
+    'concurrent_bulk': {'native': False, 'bulk': True, 'chunk_size': 2, 'workers': 3},
+}
+
+
+@pytest.fixture(scope='module', params=[parser.RESEARCHSPACE, parser.METAPHACTS], ids=['RS', 'MP'])
+def store(request):
+    store = Dataset()
+    store.parse(data=generator.generate(MODEL, request.param, add_ns_prefix=ADD_NS_PREFIX), format='trig')
+    return request.param, store
+
+def test_native_read(store):
+    flavor, store = store
+    fields = parser.read_fields(store, flavor, field_id_prefix=PREFIX, add_ns_prefix=ADD_NS_PREFIX, native=True)
+    assert [field['id'] for field in fields] == sorted(field['id'] for field in MODEL['fields'])
+    field = fields[0]
+    assert field['domain'] == ['<http://other.org/x#Y>', 'crm:E22_Human-Made_Object', 'skos:Concept']
+    assert field['defaultValue'] == ['a', 'b', 'c']
+    assert field['datatype'] == 'xsd:string'
+    assert field['maxOccurs'] == '1'
+    assert {query_type for queries in field['queries'] for query_type in queries} == {'select', 'insert', 'delete', 'ask'}
+
+@pytest.mark.parametrize('options', READ_OPTIONS.values(), ids=READ_OPTIONS.keys())
+def test_read_paths_equal_native(store, options):
+    flavor, store = store
+    native = parser.read_fields(store, flavor, field_id_prefix=PREFIX, add_ns_prefix=ADD_NS_PREFIX, native=True)
+    fields = parser.read_fields(store, flavor, field_id_prefix=PREFIX, add_ns_prefix=ADD_NS_PREFIX, **options)
+    assert fields == native
+
+def test_read_other_flavor_is_empty(store):
+    flavor, store = store
+    other = parser.METAPHACTS if flavor == parser.RESEARCHSPACE else parser.RESEARCHSPACE
+    assert parser.read_fields(store, other, native=True) == []
+    assert parser.read_fields(store, other, native=False) == []
+
+def test_field_graphs(store):
+    flavor, store = store
+    graphs = parser.field_graphs(store, flavor)
+    assert graphs == parser.field_graphs(store, flavor, native=False)
+    assert [(str(graph), str(field)) for graph, field in graphs] == [
+        (f'{PREFIX}field{i}/context', f'{PREFIX}field{i}') for i in range(7)]
+
+def _counters():
+    counters = stats.summary()['counters']
+    stats.reset()
+    return counters.get('trig_files_parsed', 0), counters.get('trig_files_cached', 0)
+
+def test_trig_cache(tmp_path):
+    trig_dir = tmp_path / 'trig'
+    trig_dir.mkdir()
+    outputs = generator.generate(MODEL, parser.RESEARCHSPACE, splitFields=True, add_ns_prefix=ADD_NS_PREFIX)
+    for i, (_, output) in enumerate(outputs[:3]):
+        (trig_dir / f'{i}.trig').write_text(output)
+    cache_file = tmp_path / 'cache.pickle'
+    stats.reset()
+    quads = set(parser.read_trig_store(trig_dir, cache_file=cache_file).quads())
+    assert _counters() == (3, 0)
+    assert set(parser.read_trig_store(trig_dir, cache_file=cache_file).quads()) == quads
+    assert _counters() == (0, 3)
+
+    # changed mtime
+    first = trig_dir / '0.trig'
+    stat = first.stat()
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert set(parser.read_trig_store(trig_dir, cache_file=cache_file).quads()) == quads
+    assert _counters() == (1, 2)
+    # changed size with same mtime
+    stat = first.stat()
+    first.write_text(outputs[3][1])
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    store = parser.read_trig_store(trig_dir, cache_file=cache_file)
+    assert [field['id'] for field in parser.read_fields(store, parser.RESEARCHSPACE, add_ns_prefix=ADD_NS_PREFIX)] \
+        == [PREFIX + f'field{i}' for i in [1, 2, 3]]
+    assert _counters() == (1, 2)
+
+    # deleted file is pruned from the cache
+    (trig_dir / '1.trig').unlink()
+    parser.read_trig_store(trig_dir, cache_file=cache_file)
+    assert _counters() == (0, 2)
+    with open(cache_file, 'rb') as f:
+        assert set(pickle.load(f)) == {str(trig_dir / '0.trig'), str(trig_dir / '2.trig')}
+
+    # workers parse like a single process
+    parallel = parser.read_trig_store(trig_dir, workers=2, cache_file=tmp_path / 'parallel.pickle')
+    assert _counters() == (2, 0)
+    assert set(parallel.quads()) == set(parser.read_trig_store(trig_dir, cache_file=cache_file).quads())
+
+def test_write_fields_yaml(store, tmp_path):
+    flavor, store = store
+    fields = parser.read_fields(store, flavor, add_ns_prefix=ADD_NS_PREFIX)
+    filename = tmp_path / 'fields.yml'
+    assert parser.write_fields_yaml(iter(fields), filename, field_id_prefix=PREFIX) == len(fields)
+    # same document as yaml.dump (libyaml may fold long scalars differently)
+    assert yaml.safe_load(filename.read_text()) == yaml.safe_load(yaml.dump({'fields': fields, 'prefix': PREFIX}))
+    assert [fn.name for fn in tmp_path.iterdir()] == ['fields.yml']
@@ -0,0 +1,66 @@
+from SemanticFieldDefinitionGenerator import generator, rdf_generator
+from rdflib import Dataset
+import pytest
+
+ADD_NS_PREFIX = {'skos': 'http://www.w3.org/2004/02/skos/core#'}
+MODEL = {
+    'prefix': 'http://example.org/fields/',
+    'fields': [{
+        'id': f'field{i}',
+        'label': f'Field {i} & <"quoted"> \'label\'',
+        'description': f'Description of `field` {i}',
+        'datatype': 'xsd:string' if i % 2 else '<http://www.w3.org/2001/XMLSchema#integer>',
+        'domain': ['crm:E22_Human-Made_Object', 'skos:Concept', '<http://other.org/x#Y>'],
+        'range': 'crm:E41_Appellation',
+        'minOccurs': 0,
+        'maxOccurs': i + 1,
+        'order': i,
+        'defaultValue': ['a', 'b & c'] if i % 2 else True,
+        'queries': [
+            {'select': f'SELECT ?value WHERE {{ $subject rdfs:label ?value . FILTER(?value != "{i}") }}'},
+            {'insert': 'INSERT { $subject crm:P1_is_identified_by $value } WHERE {}'},
+            {'delete': 'DELETE { $subject crm:P1_is_identified_by $value } WHERE {}'},
+            {'ask': 'ASK { ?value a crm:E41_Appellation . FILTER(regex(str(?value), "^a\\\\.b\\t\\u00e9")) }'},
+            {'autosuggestion': 'SELECT ?value WHERE { ?value rdfs:label ?label . FILTER(?label < 3) }'},
+            {'valueSet': 'SELECT ?value ?label WHERE { ?value a skos:Concept ; rdfs:label "\\"quoted\\" \'label\'" }'},
+        ],
+    } for i in range(4)] + [{'id': 'minimal', 'label': 'Minimal'}],
+}
+OUTPUTS = {'RS': generator.RESEARCHSPACE, 'MP': generator.METAPHACTS, 'UNI': generator.UNIVERSAL}
+
+
+def _quads(data, format):
+    store = Dataset()
+    store.parse(data=data, format=format)
+    return set(store.quads())
+
+@pytest.mark.parametrize('output', OUTPUTS.values(), ids=OUTPUTS.keys())
+def test_nquads_equal_trig(output):
+    trig = generator.generate(MODEL, output, add_ns_prefix=ADD_NS_PREFIX)
+    nquads = rdf_generator.generate(MODEL, output, add_ns_prefix=ADD_NS_PREFIX)
+    quads = _quads(nquads, 'nquads')
+    assert quads
+    assert quads == _quads(trig, 'trig')
+
+@pytest.mark.parametrize('output', OUTPUTS.values(), ids=OUTPUTS.keys())
+def test_split_nquads_equal_trig(output):
+    trig = generator.generate(MODEL, output, splitFields=True, add_ns_prefix=ADD_NS_PREFIX)
+    nquads = rdf_generator.generate(MODEL, output, splitFields=True, add_ns_prefix=ADD_NS_PREFIX)
+    assert [field_id for field_id, _ in nquads] == [field_id for field_id, _ in trig]
+    for (_, field_trig), (_, field_nquads) in zip(trig, nquads):
+        assert _quads(field_nquads, 'nquads') == _quads(field_trig, 'trig')
+
+def test_generate_dataset():
+    store = rdf_generator.generate_dataset(MODEL, generator.UNIVERSAL, add_ns_prefix=ADD_NS_PREFIX)
+    assert set(store.quads()) == _quads(generator.generate(MODEL, generator.UNIVERSAL, add_ns_prefix=ADD_NS_PREFIX), 'trig')
+
+def test_unknown_prefix():
+    model = {'prefix': 'http://example.org/fields/', 'fields': [{'id': 'f', 'label': 'F', 'domain': 'foo:Bar'}]}
+    with pytest.raises(Exception, match='field f'):
+        rdf_generator.generate(model, generator.RESEARCHSPACE)
+
+def test_bad_query_escape():
+    model = {'prefix': 'http://example.org/fields/',
+             'fields': [{'id': 'f', 'label': 'F', 'queries': [{'select': 'SELECT ?value WHERE { FILTER(regex(?value, "a\\.b")) }'}]}]}
+    with pytest.raises(Exception, match='field f'):
+        rdf_generator.generate(model, generator.RESEARCHSPACE)
@@ -0,0 +1,93 @@
+from SemanticFieldDefinitionGenerator import generator, parser
+from rdflib import Dataset
+import time
+import pytest
+
+PREFIX = 'http://example.org/fields/'
+MODEL = {
+    'prefix': PREFIX,
+    'fields': [{
+        'id': f'field{i:02d}',
+        'label': f'Field {i}',
+        'domain': ['crm:E22_Human-Made_Object', 'crm:E24_Physical_Human-Made_Thing'],
+        'datatype': 'xsd:string',
+        'queries': [{'select': f'SELECT ?value WHERE {{ $subject rdfs:label ?value }} # {i}'}],
+    } for i in range(12)],
+}
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    store = Dataset()
+    store.parse(data=generator.generate(MODEL, generator.RESEARCHSPACE), format='trig')
+    return store
+
+def _pooled_store(server, **kwargs):
+    return Dataset(parser.PooledSPARQLStore(query_endpoint=server.endpoint, backoff=0.01, **kwargs))
+
+def test_read_from_endpoint(sparql_server, dataset):
+    server = sparql_server(dataset)
+    store = parser.open_sparql_store(server.endpoint)
+    fields = parser.read_fields(store, parser.RESEARCHSPACE, field_id_prefix=PREFIX)
+    assert fields == parser.read_fields(dataset, parser.RESEARCHSPACE, field_id_prefix=PREFIX, native=True)
+    # fields query and one query per field
+    assert server.requests == len(MODEL['fields']) + 1
+
+@pytest.mark.parametrize('bulk', [False, True], ids=['per_field', 'bulk'])
+def test_retry_on_503(sparql_server, dataset, bulk):
+    server = sparql_server(dataset, fail_every=3)
+    store = _pooled_store(server)
+    fields = parser.read_fields(store, parser.RESEARCHSPACE, field_id_prefix=PREFIX, bulk=bulk, chunk_size=5)
+    assert fields == parser.read_fields(dataset, parser.RESEARCHSPACE, field_id_prefix=PREFIX, native=True)
+    # every third request failed and was retried
+    queries = len(MODEL['fields']) + 1 if not bulk else 4
+    assert server.requests > queries
+    assert server.requests - server.requests // 3 == queries
+
+def test_retry_gives_up(sparql_server, dataset):
+    server = sparql_server(dataset, fail_every=1)
+    store = _pooled_store(server, max_retries=2)
+    with pytest.raises(Exception, match='failed after 3 attempts'):
+        parser.read_fields(store, parser.RESEARCHSPACE)
+    assert server.requests == 3
+
+@pytest.mark.parametrize('bulk', [False, True], ids=['per_field', 'bulk'])
+def test_workers_keep_field_order(sparql_server, dataset, bulk):
+    # random latency makes queries finish out of order
+    server = sparql_server(dataset, jitter=0.02)
+    store = _pooled_store(server)
+    fields = parser.read_fields(store, parser.RESEARCHSPACE, field_id_prefix=PREFIX, bulk=bulk, chunk_size=2,
+                                workers=6)
+    assert [field['id'] for field in fields] == [field['id'] for field in MODEL['fields']]
+    assert fields == parser.read_fields(dataset, parser.RESEARCHSPACE, field_id_prefix=PREFIX, native=True)
+
+def test_workers_overlap_latency(sparql_server, dataset):
+    server = sparql_server(dataset, latency=0.05)
+    store = _pooled_store(server)
+    durations = {}
+    for workers in [1, 8]:
+        start = time.perf_counter()
+        fields = parser.read_fields(store, parser.RESEARCHSPACE, field_id_prefix=PREFIX, workers=workers)
+        durations[workers] = time.perf_counter() - start
+        assert len(fields) == len(MODEL['fields'])
+    # 13 sequential queries take at least 0.65s, 8 workers need two rounds of field queries
+    assert durations[8] < durations[1] / 2
+
+def test_long_query_posted(sparql_server, dataset):
+    server = sparql_server(dataset)
+    store = _pooled_store(server)
+    store.store.max_get_length = 100
+    fields = parser.read_fields(store, parser.RESEARCHSPACE, field_id_prefix=PREFIX)
+    assert fields == parser.read_fields(dataset, parser.RESEARCHSPACE, field_id_prefix=PREFIX, native=True)
+    assert server.posted_queries == server.requests == len(MODEL['fields']) + 1
+
+def test_failed_read_keeps_yaml_file(sparql_server, dataset, tmp_path):
+    filename = tmp_path / 'fields.yml'
+    filename.write_text('fields: []\n')
+    # fields query and first field query succeed
+    server = sparql_server(dataset, fail_every=3)
+    store = _pooled_store(server, max_retries=0)
+    with pytest.raises(Exception, match='failed after 1 attempts'):
+        parser.write_fields_yaml(parser.iter_fields(store, parser.RESEARCHSPACE), filename)
+    assert [fn.name for fn in tmp_path.iterdir()] == ['fields.yml']
+    assert filename.read_text() == 'fields: []\n'
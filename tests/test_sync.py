@@ -0,0 +1,122 @@
+from SemanticFieldDefinitionGenerator import generator, parser, rdf_generator, sync
+from rdflib import Dataset, Literal, URIRef
+from rdflib.namespace import RDFS
+import copy
+import pytest
+
+PREFIX = 'http://example.org/fields/'
+
+
+def _model(num_fields=3, prefix=PREFIX):
+    fields = [{
+        'id': f'field{i}',
+        'label': f'Field {i}',
+        'domain': ['crm:E22_Human-Made_Object', 'crm:E24_Physical_Human-Made_Thing'],
+        'datatype': 'xsd:string',
+        'queries': [{'select': f'SELECT ?value WHERE {{ $subject rdfs:label ?value }} # {i}'}],
+    } for i in range(num_fields)]
+    return {'prefix': prefix, 'fields': fields}
+
+def _fields(store):
+    return {field['id']: field for field in parser.read_fields(store, parser.RESEARCHSPACE)}
+
+def _store(model):
+    # in-memory stand-in for the SPARQL store
+    return rdf_generator.generate_dataset(model, parser.RESEARCHSPACE)
+
+def test_sync_empty_store_and_converge():
+    store = Dataset()
+    model = _model()
+    diff, requests = sync.sync_fields(store, model, parser.RESEARCHSPACE)
+    assert len(diff.added) == 3 and not diff.changed and not diff.removed
+    assert _fields(store) == sync.model_fields(model, parser.RESEARCHSPACE)
+
+    diff, requests = sync.sync_fields(store, model, parser.RESEARCHSPACE)
+    assert diff == sync.FieldDiff([], [], [])
+    assert requests == []
+
+def test_sync_changed_and_removed_fields():
+    store = _store(_model(3))
+    model = _model(2)
+    model['fields'][0]['label'] = 'Changed'
+    diff, _ = sync.sync_fields(store, model, parser.RESEARCHSPACE)
+    assert diff == sync.FieldDiff([], [PREFIX + 'field0'], [PREFIX + 'field2'])
+    assert _fields(store) == sync.model_fields(model, parser.RESEARCHSPACE)
+    assert sync.sync_fields(store, model, parser.RESEARCHSPACE)[1] == []
+
+def test_sync_keeps_fields_without_prefix():
+    store = _store(_model(2, prefix='http://other.org/fields/'))
+    model = _model(1, prefix='')
+    model['fields'][0]['id'] = PREFIX + 'field0'
+    diff, _ = sync.sync_fields(store, model, parser.RESEARCHSPACE, dry_run=True)
+    assert diff.added == [PREFIX + 'field0']
+    assert diff.removed == []
+
+    # explicit field id prefix
+    diff, _ = sync.sync_fields(store, model, parser.RESEARCHSPACE, field_id_prefix='http://other.org/', dry_run=True)
+    assert len(diff.removed) == 2
+
+@pytest.mark.parametrize('shared', [False, True])
+def test_sync_fields_in_other_graphs(shared):
+    # store fields in other graphs than <IRI>/context
+    store = Dataset()
+    for quads in rdf_generator.iter_quads(_model(3), parser.RESEARCHSPACE):
+        for s, p, o, g in quads:
+            graph = URIRef('http://example.org/graph/all') if shared else URIRef(str(g).replace('/context', '/other'))
+            store.add((s, p, o, graph))
+    model = _model(2)
+    model['fields'][1]['label'] = 'Changed'
+    diff, _ = sync.sync_fields(store, model, parser.RESEARCHSPACE)
+    assert diff == sync.FieldDiff([], [PREFIX + 'field1'], [PREFIX + 'field2'])
+    assert _fields(store) == sync.model_fields(model, parser.RESEARCHSPACE)
+    # no duplicate labels of changed field
+    labels = {o for _, _, o, _ in store.quads((URIRef(PREFIX + 'field1'), RDFS.label, None, None))}
+    assert labels == {Literal('Changed')}
+    assert sync.sync_fields(store, model, parser.RESEARCHSPACE)[1] == []
+
+def test_sync_store_written_as_trig():
+    # TriG parser interprets escapes in queries
+    model = _model(3)
+    model['fields'][0]['queries'] = [{'select': 'SELECT ?value WHERE { $subject rdfs:label ?value '
+                                                'FILTER(regex(?value, "^a\\\\.b \\"c\\"")) }'}]
+    store = Dataset()
+    store.parse(data=generator.generate(model, parser.RESEARCHSPACE), format='trig')
+    assert sync.sync_fields(store, model, parser.RESEARCHSPACE) == (sync.FieldDiff([], [], []), [])
+
+    model['fields'][1]['queries'] = model['fields'][0]['queries']
+    diff, _ = sync.sync_fields(store, model, parser.RESEARCHSPACE)
+    assert diff == sync.FieldDiff([], [PREFIX + 'field1'], [])
+    expected = Dataset()
+    expected.parse(data=generator.generate(model, parser.RESEARCHSPACE), format='trig')
+    assert set(store.quads()) == set(expected.quads())
+
+def test_update_requests_batches():
+    model = _model(5)
+    diff = sync.FieldDiff([PREFIX + f'field{i}' for i in range(5)], [], [])
+    requests = list(sync.update_requests(model, parser.RESEARCHSPACE, diff, batch_size=2))
+    assert len(requests) == 3
+    assert all(request.count('INSERT DATA') <= 2 for request in requests)
+
+def test_model_fields_does_not_modify_model():
+    model = _model()
+    before = copy.deepcopy(model)
+    sync.model_fields(model, parser.RESEARCHSPACE)
+    assert model == before
+
+def test_sync_converges_over_http(sparql_server):
+    dataset = _store(_model(3))
+    server = sparql_server(dataset)
+    store = parser.open_sparql_store(server.endpoint)
+    update_store = parser.open_sparql_store(server.endpoint, update=True)
+    model = _model(4)
+    model['fields'][0]['label'] = 'Changed'
+    diff, requests = sync.sync_fields(store, model, parser.RESEARCHSPACE, update_store=update_store, batch_size=1)
+    assert diff == sync.FieldDiff([PREFIX + 'field3'], [PREFIX + 'field0'], [])
+    assert server.updates == len(requests) == 2
+    assert _fields(dataset) == sync.model_fields(model, parser.RESEARCHSPACE)
+
+    # second run finds no changes
+    diff, requests = sync.sync_fields(store, model, parser.RESEARCHSPACE, update_store=update_store)
+    assert diff == sync.FieldDiff([], [], [])
+    assert requests == []
+    assert server.updates == 2
@@ -0,0 +1,80 @@
+from SemanticFieldDefinitionGenerator import generator, watch
+import os
+import urllib.parse
+import pytest
+
+PREFIX = 'http://example.org/fields/'
+OUTPUTS = {'RS': (generator.RESEARCHSPACE, '.trig'), 'JSON': (generator.JSON, '.json')}
+
+
+def _yaml(ids, label='Field'):
+    fields = ''.join(f'''    - id: {field_id}
+      label: {label} {field_id}
+      datatype: xsd:string
+      domain: crm:E22_Human-Made_Object
+''' for field_id in ids)
+    return f'prefix: {PREFIX}\nfields:\n{fields}'
+
+class Files:
+    """YAML files of a directory with increasing modification times."""
+    def __init__(self, path):
+        self.path = path
+        self.mtime = 1_600_000_000 * 10**9
+
+    def write(self, name, content):
+        fn = self.path / name
+        fn.write_text(content)
+        self.mtime += 10**9
+        os.utime(fn, ns=(self.mtime, self.mtime))
+
+    def remove(self, name):
+        (self.path / name).unlink()
+
+def _expected(yaml_dir, output):
+    source = generator.loadSourceFromFile(yaml_dir)
+    split = {urllib.parse.quote_plus(field_id): content
+             for field_id, content in generator.generate(source, output, splitFields=True)}
+    return generator.generate(source, output), split
+
+def _written(watchers, suffix):
+    unsplit, split = watchers
+    return (unsplit.output_file.read_text(),
+            {fn.name[:-len(suffix)]: fn.read_text() for fn in split.output_file.iterdir()})
+
+@pytest.mark.parametrize('output', OUTPUTS.values(), ids=OUTPUTS.keys())
+def test_watcher_builds_changes(tmp_path, output):
+    output, suffix = output
+    yaml_dir = tmp_path / 'yaml'
+    yaml_dir.mkdir()
+    (tmp_path / 'split').mkdir()
+    files = Files(yaml_dir)
+    files.write('a.yml', _yaml(['a1', 'a2']))
+    files.write('b.yml', _yaml(['b1']))
+    watchers = (watch.FieldWatcher(yaml_dir, tmp_path / f'fields{suffix}', output, suffix=suffix),
+                watch.FieldWatcher(yaml_dir, tmp_path / 'split', output, split_fields=True, suffix=suffix))
+
+    def build(changed, removed):
+        for watcher in watchers:
+            assert watcher.build() == (changed, removed)
+            assert watcher.build() is None
+        assert _written(watchers, suffix) == _expected(yaml_dir, output)
+
+    build(3, 0)
+    # edit file
+    files.write('a.yml', _yaml(['a1', 'a2', 'a3'], label='Changed'))
+    build(3, 0)
+    # add file
+    files.write('c.yml', _yaml(['c1']))
+    build(1, 0)
+    # remove file
+    files.remove('b.yml')
+    build(0, 1)
+
+    # syntax error keeps last parsed content of file
+    expected = _expected(yaml_dir, output)
+    files.write('c.yml', 'fields: [')
+    for watcher in watchers:
+        assert watcher.build() == (0, 0)
+    assert _written(watchers, suffix) == expected
+    files.write('c.yml', _yaml(['c1', 'c2']))
+    build(1, 0)